@@ -10,3 +10,28 @@ class UniversityAdmin(admin.ModelAdmin):
 class FavoriteUniversityAdmin(admin.ModelAdmin):
     list_display = ('user', 'university', 'added_at')
     search_fields = ('user__username', 'university__name')
+
+@admin.register(GeocodeJob)
+class GeocodeJobAdmin(admin.ModelAdmin):
+    list_display = ('query', 'country', 'status', 'attempts', 'updated_at')
+    list_filter = ('status', 'country')
+    search_fields = ('query',)
+
+@admin.register(GeocodeCacheEntry)
+class GeocodeCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('query', 'found', 'lat', 'lng', 'expires_at')
+    list_filter = ('found',)
+    search_fields = ('key',)
+
+@admin.register(RateLimit)
+class RateLimitAdmin(admin.ModelAdmin):
+    list_display = ('name', 'next_at')
+
+@admin.register(CountrySync)
+class CountrySyncAdmin(admin.ModelAdmin):
+    list_display = ('country_key', 'synced_at', 'changed_at')
+    search_fields = ('country_key',)
+
+@admin.register(BackfillCheckpoint)
+class BackfillCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('name', 'from_id', 'to_id', 'last_id', 'located', 'not_found', 'failed', 'finished_at')
@@ -0,0 +1,302 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+from array import array
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+
+from .metrics import registry
+from .models import University
+from .search import normalize_name
+from . import versions
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_BYTES = 255  # normalized names are cut here, so a token offset fits in the entry's low byte
+SCAN_PER_RESULT = 20  # entries looked at per requested result before ranking
+RECENT_LIMIT = 20000  # entries added since the build kept in small arrays of their own, then merged in
+
+
+class PrefixIndex:
+    """Prefix search over the tokens of normalized university names.
+
+    Every university gets one entry per token of its normalize_name()
+    ("universidad de lima" -> "universidad de lima", "de lima", "lima"), so
+    typing the start of any word finds it. Names are kept in two bytearrays
+    (normalized, and as displayed) and an entry is a single 64-bit int,
+    row << 8 | byte offset of the token, in two arrays sorted by the suffix
+    from that offset: one over all rows and one by (country, suffix). A few
+    dozen bytes per university instead of Python objects keeps a world-sized
+    list small; rows beyond `max_bytes` are left out (`truncated`).
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.truncated = False
+        self.ids = array('q')  # ascending: rows are added in id order
+        self.country_of = array('H')
+        self.keys = bytearray()
+        self.key_offsets = array('I', [0])
+        self.names = bytearray()
+        self.name_offsets = array('I', [0])
+        self.countries = []  # display name per country index
+        self.country_bytes = 0
+        self.country_index = {}  # country_key -> country index
+        self.live = Counter()  # country index -> rows not deleted
+        self.dead = set()  # rows of deleted universities
+        self.entries = array('Q')
+        self.by_country = array('Q')
+        # Inserting into the big arrays shifts them; refreshes insert here instead
+        self.recent = array('Q')
+        self.recent_by_country = array('Q')
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids) - len(self.dead)
+
+    @property
+    def max_id(self):
+        return self.ids[-1] if self.ids else 0
+
+    def nbytes(self):
+        arrays = (
+            self.ids, self.country_of, self.key_offsets, self.name_offsets,
+            self.entries, self.by_country, self.recent, self.recent_by_country,
+        )
+        return (
+            len(self.keys) + len(self.names) + sum(a.itemsize * len(a) for a in arrays)
+            + self.country_bytes + 80 * len(self.dead)
+        )
+
+    def _suffix(self, entry):
+        row = entry >> 8
+        return self.keys[self.key_offsets[row] + (entry & 0xFF):self.key_offsets[row + 1]]
+
+    def _country_suffix(self, entry):
+        return self.country_of[entry >> 8], self._suffix(entry)
+
+    def _add(self, uni_id, name, country, country_key, pending=0):
+        """Append one university; returns its entries, or None if it has no indexable name or no room is left.
+
+        `pending` is the number of entries added but not sorted in yet.
+        """
+        key = normalize_name(name).encode()[:MAX_KEY_BYTES]
+        display = name.encode()
+        if not key:
+            return None
+        # Per row: the two strings, an id, a country and two offsets, and each entry in both arrays
+        size = len(key) + len(display) + 18 + 16 * (key.count(b' ') + 1)
+        if self.nbytes() + 16 * pending + size + len(country) + 100 > self.max_bytes:
+            self.truncated = True
+            return None
+
+        if country_key not in self.country_index:
+            self.country_index[country_key] = len(self.countries)
+            self.countries.append(country)
+            self.country_bytes += len(country) + 100
+        row = len(self.ids)
+        self.ids.append(uni_id)
+        self.country_of.append(self.country_index[country_key])
+        self.keys += key
+        self.key_offsets.append(len(self.keys))
+        self.names += display
+        self.name_offsets.append(len(self.names))
+        self.live[self.country_index[country_key]] += 1
+        return [row << 8] + [row << 8 | i + 1 for i, byte in enumerate(key) if byte == 0x20 and i + 1 < len(key)]
+
+    def add_rows(self, rows):
+        """Index (id, name, country, country_key) rows with ids above max_id, in id order."""
+        new = []
+        for row in rows:
+            if self.truncated:
+                break
+            entries = self._add(*row, pending=len(new))
+            if entries:
+                new += entries
+        if not new:
+            return 0
+        if self.entries and len(self.recent) + len(new) <= RECENT_LIMIT:
+            for entry in new:
+                bisect.insort(self.recent, entry, key=self._suffix)
+                bisect.insort(self.recent_by_country, entry, key=self._country_suffix)
+        else:
+            self.entries = array('Q', heapq.merge(
+                self.entries, self.recent, sorted(new, key=self._suffix), key=self._suffix
+            ))
+            self.by_country = array('Q', heapq.merge(
+                self.by_country, self.recent_by_country, sorted(new, key=self._country_suffix), key=self._country_suffix
+            ))
+            self.recent, self.recent_by_country = array('Q'), array('Q')
+        return len(new)
+
+    def remove_missing(self, country_key, stored_ids):
+        """Mark the rows of `country_key` whose ids are no longer stored as deleted."""
+        country = self.country_index.get(country_key)
+        if country is None:
+            return 0
+        gone = set()
+        for entries in (self.by_country, self.recent_by_country):
+            lo = bisect.bisect_left(entries, country, key=lambda e: self.country_of[e >> 8])
+            hi = bisect.bisect_right(entries, country, key=lambda e: self.country_of[e >> 8])
+            gone.update(
+                entry >> 8 for entry in entries[lo:hi]
+                if entry >> 8 not in self.dead and self.ids[entry >> 8] not in stored_ids
+            )
+        self.dead |= gone
+        self.live[country] -= len(gone)
+        return len(gone)
+
+    def complete(self, query, country_key=None, limit=10):
+        """Up to `limit` universities with a name word starting with `query`.
+
+        Whole-name matches rank before matches on a later word, then shorter
+        names first; only the first `limit * SCAN_PER_RESULT` entries of the
+        matching range are ranked, which keeps short prefixes fast.
+        """
+        prefix = normalize_name(query).encode()[:MAX_KEY_BYTES]
+        if not prefix:
+            return []
+
+        with self._lock:
+            if country_key is None:
+                country = None
+                sources = [(entries, bisect.bisect_left(entries, prefix, key=self._suffix))
+                           for entries in (self.entries, self.recent)]
+            else:
+                country = self.country_index.get(country_key)
+                if country is None:
+                    return []
+                sources = [(entries, bisect.bisect_left(entries, (country, prefix), key=self._country_suffix))
+                           for entries in (self.by_country, self.recent_by_country)]
+
+            ranked = {}
+            for entries, start in sources:
+                for entry in entries[start:start + limit * SCAN_PER_RESULT]:
+                    row, offset = entry >> 8, entry & 0xFF
+                    if country is not None and self.country_of[row] != country:
+                        break
+                    begin = self.key_offsets[row] + offset
+                    if self.keys[begin:begin + len(prefix)] != prefix:
+                        break
+                    if row in self.dead:
+                        continue
+                    rank = (offset != 0, self.key_offsets[row + 1] - self.key_offsets[row])
+                    if rank < ranked.get(row, (True, MAX_KEY_BYTES + 1)):
+                        ranked[row] = rank
+
+            return [
+                {
+                    "id": self.ids[row],
+                    "name": self.names[self.name_offsets[row]:self.name_offsets[row + 1]].decode(),
+                    "country": self.countries[self.country_of[row]],
+                }
+                for row in sorted(ranked, key=lambda row: (ranked[row], row))[:limit]
+            ]
+
+    def refresh(self):
+        """Pick up universities added or deleted since the last refresh.
+
+        New rows are found by id (ids only grow); deletions by comparing
+        per-country counts, then the ids of the countries that differ.
+        """
+        rows = (
+            University.objects.filter(id__gt=self.max_id).order_by('id')
+            .values_list('id', 'name', 'country', 'country_key').iterator(chunk_size=5000)
+        )
+        with self._lock:
+            added = 0 if self.truncated else self.add_rows(rows)
+
+        removed = 0
+        counts = dict(University.objects.values_list('country_key').annotate(n=Count('id')).order_by())
+        for country_key, country in self.country_index.items():
+            if counts.get(country_key, 0) < self.live[country]:
+                stored = set(University.objects.filter(country_key=country_key).values_list('id', flat=True))
+                with self._lock:
+                    removed += self.remove_missing(country_key, stored)
+        return added, removed
+
+    def stats(self):
+        return {
+            "rows": len(self),
+            "entries": len(self.entries) + len(self.recent),
+            "bytes": self.nbytes(),
+            "max_bytes": self.max_bytes,
+            "truncated": self.truncated,
+        }
+
+
+def build_index():
+    index = PrefixIndex(settings.AUTOCOMPLETE_MAX_MB * 1024 * 1024)
+    index.add_rows(
+        University.objects.order_by('id').values_list('id', 'name', 'country', 'country_key').iterator(chunk_size=5000)
+    )
+    return index
+
+
+_index = None
+_index_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _report(index, started, action):
+    stats = index.stats()
+    registry.set('autocomplete_index_bytes', stats["bytes"])
+    registry.set('autocomplete_index_rows', stats["rows"])
+    log = logger.warning if stats["truncated"] else logger.info
+    log(
+        'Autocomplete index %s in %.0f ms: %d universities, %d entries, %.1f of %.0f MB%s',
+        action, (time.monotonic() - started) * 1000, stats["rows"], stats["entries"],
+        stats["bytes"] / 2 ** 20, stats["max_bytes"] / 2 ** 20,
+        ' (truncated: raise AUTOCOMPLETE_MAX_MB)' if stats["truncated"] else '',
+    )
+
+
+def get_index():
+    """This process's PrefixIndex, refreshed at most every AUTOCOMPLETE_REFRESH_INTERVAL seconds.
+
+    Only the first call waits for the build; while a refresh runs, other
+    requests keep using the index as it is.
+    """
+    global _index, _index_version, _checked_at
+
+    if _index is not None and time.monotonic() - _checked_at < settings.AUTOCOMPLETE_REFRESH_INTERVAL:
+        return _index
+    if not _lock.acquire(blocking=_index is None):
+        return _index
+    try:
+        if _index is not None and time.monotonic() - _checked_at < settings.AUTOCOMPLETE_REFRESH_INTERVAL:
+            return _index
+        started = time.monotonic()
+        version = versions.current_version()  # read first, so changes made during the refresh are seen next time
+        # Deleted rows are only skipped; rebuild once they make up a fifth of a sizeable index
+        if _index is None or len(_index.dead) > max(len(_index.ids) // 5, 1000):
+            _index = build_index()
+            _report(_index, started, 'built')
+        elif version != _index_version:
+            added, removed = _index.refresh()
+            if added or removed:
+                _report(_index, started, f'refreshed (+{added} entries, -{removed} universities)')
+        _index_version = version
+        _checked_at = time.monotonic()
+        return _index
+    finally:
+        _lock.release()
+
+
+def warm_up():
+    """Build the index in the background when a worker starts, so no request waits for it."""
+    def build():
+        try:
+            get_index()
+        except Exception:  # e.g. migrations not applied yet; the first request builds it instead
+            logger.exception('Autocomplete index warm-up failed')
+        finally:
+            connection.close()
+
+    threading.Thread(target=build, name='autocomplete-warm-up', daemon=True).start()
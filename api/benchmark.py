@@ -0,0 +1,280 @@
+import gzip
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .clusters import rebuild_clusters
+from .countries import FEATURED_COUNTRIES, normalize_country
+from .geo import geohash_for
+from .models import University
+from .ratelimit import nominatim_limiter
+from . import versions
+
+SYNTHETIC_COUNTRIES = 40
+SNAPSHOT_COUNTRY = FEATURED_COUNTRIES[0]  # served from a snapshot
+PLAIN_COUNTRY = 'Benchland 00'            # served by the fast path
+IMPORT_ROWS = 10000
+
+
+def seed_countries():
+    return [*FEATURED_COUNTRIES, *(f'Benchland {i:02d}' for i in range(SYNTHETIC_COUNTRIES))]
+
+
+def country_center(country):
+    k = seed_countries().index(country)
+    return -50.0 + (k * 37) % 110, -170.0 + (k * 53) % 340
+
+
+def seed(size, located=0.9, batch_size=10000):
+    """Top the University table up to `size` synthetic rows spread over seed_countries().
+
+    Rows already there are kept, so seeding 1k, then 100k, then 1M only inserts
+    the difference. A `located` share of rows gets coordinates near its
+    country's centre.
+    """
+    countries = seed_countries()
+    centers = {country: country_center(country) for country in countries}
+    start = University.objects.count()
+    rng = random.Random(start)
+
+    batch = []
+    for i in range(start, size):
+        country = countries[i % len(countries)]
+        lat = lng = None
+        if rng.random() < located:
+            clat, clng = centers[country]
+            lat, lng = clat + rng.uniform(-5, 5), clng + rng.uniform(-5, 5)
+        batch.append(University(
+            name=f'Synthetic University {i:07d}', country=country, country_key=normalize_country(country),
+            lat=lat, lng=lng, geohash=geohash_for(lat, lng),
+        ))
+        if len(batch) >= batch_size:
+            University.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    University.objects.bulk_create(batch, ignore_conflicts=True)
+    versions.bump([normalize_country(c) for c in countries])
+    return size - start
+
+
+def percentile(sorted_values, p):
+    # Nearest rank, as in api/upstream.py
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+
+@dataclass
+class Case:
+    name: str
+    call: object  # call(i) -> HTTP status (or 0 for commands); i counts every run of the case
+    requests: int = None  # overrides the suite's request count
+    warmup: int = 1
+
+
+def measure(case, requests):
+    """Run `case` and summarise wall time, throughput and DB queries per call."""
+    n = case.requests or requests
+    timings, queries, errors = [], [], 0
+    for i in range(case.warmup + n):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            status = case.call(i)
+            elapsed = time.perf_counter() - started
+        if i < case.warmup:
+            continue
+        timings.append(elapsed)
+        queries.append(len(ctx.captured_queries))
+        errors += status >= 500
+
+    timings.sort()
+    queries.sort()
+    return {
+        "name": case.name,
+        "requests": n,
+        "errors": errors,
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+        "mean_ms": round(sum(timings) / n * 1000, 3),
+        "throughput_rps": round(n / sum(timings), 2) if sum(timings) else None,
+        "queries_p50": percentile(queries, 0.50),
+        "queries_max": queries[-1],
+    }
+
+
+def _fetch(client, path, method='get', **kwargs):
+    response = getattr(client, method)(path, **kwargs)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response.status_code
+
+
+def _url(path, **params):
+    return f'{path}?{urlencode(params)}' if params else path
+
+
+def _write_dump(rows):
+    fd, path = tempfile.mkstemp(suffix='.json.gz')
+    with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as fp:
+        json.dump([
+            {"name": f"Imported University {i}", "country": f"Importland {i % 10}", "domains": []}
+            for i in range(rows)
+        ], fp)
+    return path
+
+
+def endpoint_cases(size, tag):
+    """Every route in api/urls.py, the universities page and the load commands.
+
+    `tag` makes the names of cold countries unique per run, so those cases
+    always reach the (stub) upstreams.
+    """
+    anonymous = Client()
+    client = Client()
+    user, _ = User.objects.get_or_create(username='bench')
+    client.force_login(user)
+    staff = Client()
+    staff.force_login(User.objects.get_or_create(username='bench-staff', defaults={'is_staff': True})[0])
+    async_client = AsyncClient()
+
+    lat, lng = country_center(PLAIN_COUNTRY)
+    plain_ids = list(University.objects.filter(country_key=normalize_country(PLAIN_COUNTRY))
+                     .order_by('id').values_list('id', flat=True)[:100])
+    searched = University.objects.filter(country_key=normalize_country(PLAIN_COUNTRY)).order_by('id').first()
+    silent = io.StringIO()
+
+    def command(*args):
+        call_command(*args, stdout=silent, stderr=silent)
+        return 0
+
+    def favorites(i):
+        method = 'post' if i % 2 == 0 else 'delete'
+        return _fetch(client, '/api/favorites/', method, data=json.dumps({"university_ids": plain_ids}),
+                      content_type='application/json')
+
+    dump = _write_dump(min(size, IMPORT_ROWS))
+    # Mostly exact names, some only matching once normalized, a few for Nominatim
+    plain_names = list(University.objects.filter(id__in=plain_ids).values_list('name', flat=True))
+    batch = [*plain_names, *(name.upper() for name in plain_names[:20])]
+
+    def resolve(i):
+        items = [*batch, *(f'Unknown College {tag} {i} {k}' for k in range(5))]
+        return _fetch(anonymous, '/api/search-university/batch/', 'post', data=json.dumps({"items": items}),
+                      content_type='application/json')
+
+    cases = [
+        Case('GET /api/test/', lambda i: _fetch(anonymous, '/api/test/')),
+        Case('GET /api/universities/ (snapshot)',
+             lambda i: _fetch(anonymous, _url('/api/universities/', country=SNAPSHOT_COUNTRY))),
+        Case('GET /api/universities/ (fast path)',
+             lambda i: _fetch(anonymous, _url('/api/universities/', country=PLAIN_COUNTRY))),
+        Case('GET /api/universities/ (keyset page)',
+             lambda i: _fetch(anonymous, _url('/api/universities/', limit=100))),
+        Case('GET /api/universities/ (cold country)',
+             lambda i: _fetch(anonymous, _url('/api/universities/', country=f'Coldland {tag} {i}')), warmup=0),
+        Case('GET /api/universities/export/ (country, ndjson)',
+             lambda i: _fetch(anonymous, _url('/api/universities/export/', country=PLAIN_COUNTRY))),
+        Case('GET /api/universities/export/ (all, csv)',
+             lambda i: _fetch(anonymous, _url('/api/universities/export/', format='csv')), requests=1, warmup=0),
+        Case('GET /api/universities/nearby/',
+             lambda i: _fetch(anonymous, _url('/api/universities/nearby/', lat=lat, lng=lng, radius=100))),
+        Case('GET /api/search-university/ (local)',
+             lambda i: _fetch(anonymous, _url('/api/search-university/', name=searched.name))),
+        Case('GET /api/search-university/ (nominatim)',
+             lambda i: _fetch(anonymous, _url('/api/search-university/', name=f'Nowhere Institute {tag} {i}')),
+             warmup=0),
+        Case('POST /api/search-university/batch/ (125 names)', resolve),
+        Case('GET /api/universities/autocomplete/',
+             lambda i: _fetch(anonymous, _url('/api/universities/autocomplete/', q=searched.name.split()[0][:4]))),
+        Case('GET /api/university-locations/ (snapshot)',
+             lambda i: _fetch(anonymous, _url('/api/university-locations/', country=SNAPSHOT_COUNTRY))),
+        Case('GET /api/university-locations/',
+             lambda i: _fetch(anonymous, _url('/api/university-locations/', country=PLAIN_COUNTRY))),
+        Case('GET /api/university-clusters/',
+             lambda i: _fetch(anonymous, _url('/api/university-clusters/', country=PLAIN_COUNTRY, zoom=4))),
+        Case('GET /api/user/', lambda i: _fetch(client, '/api/user/')),
+        Case('GET /api/favorites/', lambda i: _fetch(client, '/api/favorites/')),
+        Case('POST/DELETE /api/favorites/ (100 ids)', favorites),
+        Case('GET /api/metrics/', lambda i: _fetch(staff, '/api/metrics/')),
+        Case('GET /api/async/universities/',
+             lambda i: async_to_sync(async_client.get)(_url('/api/async/universities/', country=PLAIN_COUNTRY)).status_code),
+        Case('GET /api/async/search-university/',
+             lambda i: async_to_sync(async_client.get)(_url('/api/async/search-university/', name=searched.name)).status_code),
+        Case('GET /universities/ (page 1)',
+             lambda i: _fetch(client, _url('/universities/', country=PLAIN_COUNTRY))),
+        Case('GET /universities/ (stream)',
+             lambda i: _fetch(client, _url('/universities/', country=PLAIN_COUNTRY, stream=1))),
+        Case('build_clusters', lambda i: command('build_clusters', '--countries', PLAIN_COUNTRY), requests=3, warmup=0),
+        Case('load_universities (1 cold country)',
+             lambda i: command('load_universities', '--countries', f'Loadland {tag} {i}'), requests=3, warmup=0),
+        Case('fetch_universities (1 cold country)',
+             lambda i: command('fetch_universities', '--country', f'Fetchland {tag} {i}'), requests=3, warmup=0),
+        Case(f'import_universities ({min(size, IMPORT_ROWS)} rows)',
+             lambda i: command('import_universities', dump), requests=3, warmup=0),
+    ]
+    return cases, dump
+
+
+def run_suite(sizes, requests, stub, snapshot_dir, nominatim_rate=0, progress=None):
+    """Seed each dataset size in turn and measure every case against it.
+
+    Upstream calls go to `stub` (a started StubUpstream). Returns
+    {size: [result, ...]} with sizes as strings, ready for json.dump.
+    """
+    results = {}
+    run_id = time.strftime('%Y%m%d%H%M%S')
+    saved_rate = nominatim_limiter.rate
+    nominatim_limiter.rate = nominatim_rate
+    try:
+        with override_settings(
+            HIPOLABS_URL=stub.hipolabs_url, NOMINATIM_URL=stub.nominatim_url, SNAPSHOT_DIR=snapshot_dir,
+        ):
+            for size in sorted(sizes):
+                started = time.perf_counter()
+                seed(size)
+                rebuild_clusters(normalize_country(PLAIN_COUNTRY))
+                if progress:
+                    progress(f'Seeded {size} universities in {time.perf_counter() - started:.1f}s')
+
+                cases, dump = endpoint_cases(size, tag=f'{size}-{run_id}')
+                try:
+                    results[str(size)] = []
+                    for case in cases:
+                        result = measure(case, requests)
+                        results[str(size)].append(result)
+                        if progress:
+                            progress(
+                                f'  {case.name:<50} p50 {result["p50_ms"]:>9.2f} ms  p99 {result["p99_ms"]:>9.2f} ms  '
+                                f'{result["queries_p50"]:>4} queries  {result["errors"]} errors'
+                            )
+                finally:
+                    os.remove(dump)
+    finally:
+        nominatim_limiter.rate = saved_rate
+    return results
+
+
+def compare(previous, current):
+    """Lines comparing p50/p99 of the cases two result files have in common."""
+    lines = []
+    for size, rows in current["results"].items():
+        before = {row["name"]: row for row in previous.get("results", {}).get(size, [])}
+        for row in rows:
+            old = before.get(row["name"])
+            if not old or not old["p50_ms"] or not old["p99_ms"]:
+                continue
+            lines.append(
+                f'{size:>8} {row["name"]:<50} p50 x{row["p50_ms"] / old["p50_ms"]:.2f}  '
+                f'p99 x{row["p99_ms"] / old["p99_ms"]:.2f}  queries {old["queries_p50"]} -> {row["queries_p50"]}'
+            )
+    return lines
@@ -0,0 +1,138 @@
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+
+from .models import University, UniversityCluster
+from .singleflight import single_flight
+
+TILE_SIZE = 256
+MAX_MERCATOR_LAT = 85.05112878
+MAX_POINTS = 500
+
+
+def world_pixel(lat, lng, zoom):
+    """Web Mercator pixel coordinates of (lat, lng) at `zoom`, as used by Google Maps."""
+    lat = min(max(lat, -MAX_MERCATOR_LAT), MAX_MERCATOR_LAT)
+    scale = TILE_SIZE * 2 ** zoom
+    siny = math.sin(math.radians(lat))
+    x = (lng + 180.0) / 360.0 * scale
+    y = (0.5 - math.log((1 + siny) / (1 - siny)) / (4 * math.pi)) * scale
+    return x, y
+
+
+def cell_of(lat, lng, zoom):
+    x, y = world_pixel(lat, lng, zoom)
+    return int(x // settings.CLUSTER_CELL_PX), int(y // settings.CLUSTER_CELL_PX)
+
+
+def build_clusters(country_key):
+    """Recompute every zoom level of the grid clusters for one country.
+
+    Cells holding two or more universities get a row per zoom level. A university
+    that is alone in its cell stays alone at every finer zoom, so it is stored once,
+    as a single-member row at the first zoom where it stands alone.
+    """
+    max_zoom = settings.CLUSTER_MAX_ZOOM
+    rows = University.objects.filter(
+        country_key=country_key, lat__isnull=False, lng__isnull=False
+    ).values_list('id', 'lat', 'lng')
+
+    # Project once at max_zoom; coarser cells are the same pixel shifted right by (max_zoom - zoom)
+    points = []
+    for uni_id, lat, lng in rows.iterator(chunk_size=5000):
+        x, y = world_pixel(lat, lng, max_zoom)
+        points.append((uni_id, lat, lng, int(x), int(y)))
+
+    clusters = []
+    groups = [points]  # universities still sharing a cell with someone else
+    for zoom in range(max_zoom + 1):
+        shift = max_zoom - zoom
+        next_groups = []
+        for group in groups:
+            cells = {}
+            for point in group:
+                key = ((point[3] >> shift) // settings.CLUSTER_CELL_PX, (point[4] >> shift) // settings.CLUSTER_CELL_PX)
+                cells.setdefault(key, []).append(point)
+            for (cx, cy), members in cells.items():
+                count = len(members)
+                clusters.append(UniversityCluster(
+                    country_key=country_key, zoom=zoom, cell_x=cx, cell_y=cy, count=count,
+                    lat=sum(m[1] for m in members) / count, lng=sum(m[2] for m in members) / count,
+                    university_id=members[0][0] if count == 1 else None,
+                ))
+                if count > 1:
+                    next_groups.append(members)
+        groups = next_groups
+
+    with transaction.atomic():
+        UniversityCluster.objects.filter(country_key=country_key).delete()
+        UniversityCluster.objects.bulk_create(clusters, batch_size=1000)
+    return len(clusters)
+
+
+def rebuild_clusters(country_key, wait=0):
+    """Rebuild the country's clusters unless another process is already rebuilding them.
+
+    Called by writers (the geocode worker, load_universities, build_clusters), never
+    on the read path. Returns the number of clusters built, or None if skipped.
+    """
+    with single_flight(f'clusters:{country_key}', wait, settings.CLUSTER_REBUILD_LOCK_TIMEOUT) as acquired:
+        if not acquired:
+            return None
+        return build_clusters(country_key)
+
+
+def _cell_ranges(south, west, north, east, zoom):
+    x0, y0 = cell_of(north, west, zoom)
+    x1, y1 = cell_of(south, east, zoom)
+    if west <= east:
+        return [(x0, x1)], (y0, y1)
+    # The viewport crosses the antimeridian: split into two x ranges
+    last = int(TILE_SIZE * 2 ** zoom // settings.CLUSTER_CELL_PX)
+    return [(x0, last), (0, x1)], (y0, y1)
+
+
+def clusters_in_view(country_key, zoom, bbox):
+    """Clusters (and single universities) for the viewport `bbox` = (south, west, north, east)."""
+    south, west, north, east = bbox
+
+    if zoom > settings.CLUSTER_MAX_ZOOM:
+        qs = University.objects.filter(
+            country_key=country_key, lat__range=(south, north), lat__isnull=False, lng__isnull=False
+        )
+        qs = qs.filter(lng__range=(west, east)) if west <= east else qs.exclude(lng__range=(east, west))
+        points = [
+            {"id": uni_id, "name": name, "country": country, "lat": lat, "lng": lng}
+            for uni_id, name, country, lat, lng in qs.values_list('id', 'name', 'country', 'lat', 'lng')[:MAX_POINTS]
+        ]
+        return {"zoom": zoom, "clusters": [], "points": points}
+
+    # Levels are rebuilt by writers (see rebuild_clusters); reads serve whatever is stored
+    clusters = []
+    x_ranges, (y0, y1) = _cell_ranges(south, west, north, east, zoom)
+    for x0, x1 in x_ranges:
+        clusters.extend(UniversityCluster.objects.filter(
+            country_key=country_key, zoom=zoom, count__gt=1, cell_x__range=(x0, x1), cell_y__range=(y0, y1)
+        ).values('lat', 'lng', 'count'))
+
+    # Universities that became alone in their cell at this zoom or earlier
+    singles = UniversityCluster.objects.filter(
+        country_key=country_key, zoom__lte=zoom, count=1, lat__range=(south, north)
+    )
+    singles = singles.filter(lng__range=(west, east)) if west <= east else singles.exclude(lng__range=(east, west))
+    points = [
+        {"id": uni_id, "name": name, "country": country, "lat": lat, "lng": lng}
+        for uni_id, name, country, lat, lng in singles.filter(university__isnull=False).values_list(
+            'university_id', 'university__name', 'university__country', 'university__lat', 'university__lng'
+        )[:MAX_POINTS]
+    ]
+    return {"zoom": zoom, "clusters": clusters, "points": points}
+
+
+def country_bounds(country_key):
+    bounds = University.objects.filter(
+        country_key=country_key, lat__isnull=False, lng__isnull=False
+    ).aggregate(south=Min('lat'), west=Min('lng'), north=Max('lat'), east=Max('lng'))
+    return bounds if bounds['south'] is not None else None
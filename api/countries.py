@@ -0,0 +1,17 @@
+# Countries offered in the frontend country selector (and loaded by default)
+FEATURED_COUNTRIES = [
+    "Philippines",
+    "Japan",
+    "India",
+    "Australia",
+    "Canada",
+    "Singapore",
+    "Thailand",
+    "Saudi Arabia",
+    "United Kingdom",
+]
+
+
+def normalize_country(country):
+    """Case- and whitespace-insensitive key used for every country lookup."""
+    return " ".join((country or "").casefold().split())
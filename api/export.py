@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+import zlib
+
+from django.conf import settings
+
+from .fastjson import FIELDS, dumps
+
+# format -> (content type, file extension)
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'geojson': ('application/geo+json', 'geojson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+
+
+def _rows(queryset):
+    # values_list over iterator(): a server-side cursor on Postgres, fetchmany() elsewhere,
+    # so only one chunk of tuples is held at a time
+    for values in queryset.order_by('id').values_list(*FIELDS).iterator(chunk_size=settings.EXPORT_CHUNK_ROWS):
+        yield dict(zip(FIELDS, values))
+
+
+def _ndjson(rows):
+    for row in rows:
+        yield dumps(row, [row]) + b'\n'
+
+
+def _geojson(rows):
+    yield b'{"type":"FeatureCollection","features":['
+    separator = b''
+    for row in rows:
+        has_point = row['lat'] is not None and row['lng'] is not None
+        feature = {
+            "type": "Feature",
+            "id": row['id'],
+            "geometry": {"type": "Point", "coordinates": [row['lng'], row['lat']]} if has_point else None,
+            "properties": {"name": row['name'], "country": row['country']},
+        }
+        yield separator + json.dumps(feature, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+        separator = b','
+    yield b']}'
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow(['' if row[f] is None else row[f] for f in FIELDS])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+ENCODERS = {'ndjson': _ndjson, 'geojson': _geojson, 'csv': _csv}
+
+
+def _batched(pieces, size):
+    # One write per ~`size` bytes instead of one per row
+    batch, length = [], 0
+    for piece in pieces:
+        batch.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield b''.join(batch)
+            batch, length = [], 0
+    if batch:
+        yield b''.join(batch)
+
+
+def _gzipped(blocks):
+    compressor = zlib.compressobj(settings.EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(queryset, fmt, gzipped=False):
+    """Byte chunks of `queryset` encoded as `fmt`, produced lazily with flat memory use."""
+    blocks = _batched(ENCODERS[fmt](_rows(queryset)), settings.EXPORT_BLOCK_BYTES)
+    return _gzipped(blocks) if gzipped else blocks
@@ -0,0 +1,62 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder produces the same bytes, only slower
+    orjson = None
+
+from .metrics import serialization
+
+FIELDS = ('id', 'name', 'country', 'lat', 'lng')
+
+
+def university_rows(queryset):
+    """UniversitySerializer output as plain dicts, read as tuples without model instances."""
+    return [dict(zip(FIELDS, row)) for row in queryset.values_list(*FIELDS)]
+
+
+def location_rows(queryset):
+    """UniversityLocationsView markers, read as tuples without model instances."""
+    return [
+        {
+            "id": uni_id,
+            "name": name,
+            "country": country,
+            "lat": lat,
+            "lng": lng,
+            "address": f"{name}, {country}",
+            "place_id": ""
+        }
+        for uni_id, name, country, lat, lng in queryset.values_list(*FIELDS)
+    ]
+
+
+def _orjson_exact(rows):
+    # orjson and repr() only disagree on floats that repr() writes with an exponent
+    for row in rows:
+        for value in (row['lat'], row['lng']):
+            if value and not 1e-4 <= abs(value) < 1e16:
+                return False
+    return True
+
+
+def dumps(data, rows=()):
+    """Encode `data` to exactly the bytes DRF's JSONRenderer produces for it.
+
+    That is compact separators, raw UTF-8 (UNICODE_JSON), no NaN (STRICT_JSON) and
+    escaped U+2028/U+2029. `rows` are the university/location dicts inside `data`;
+    orjson is only used when none of their coordinates would be formatted differently.
+    """
+    with serialization():
+        return _dumps(data, rows)
+
+
+def _dumps(data, rows):
+    if orjson is not None and _orjson_exact(rows):
+        content = orjson.dumps(data)
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return content
+
+    content = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    return content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import FavoriteUniversity, University
+from . import versions
+
+
+def favorites_version(request):
+    """The user's favorites version, read once per request (None when logged out)."""
+    if not hasattr(request, '_favorites_version'):
+        user = request.user
+        request._favorites_version = versions.favorites_version(user.pk) if user.is_authenticated else None
+    return request._favorites_version
+
+
+def favorite_ids(request):
+    """IDs of the universities the user has favorited, as a frozenset for O(1) lookups per row.
+
+    Cached per favorites version, so a change made by any process is seen by the
+    next request, and a page renders with no favorite queries once cached.
+    """
+    version = favorites_version(request)
+    if version is None:
+        return frozenset()
+
+    key = f'favorites:{request.user.pk}:{version}'
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(FavoriteUniversity.objects.filter(user=request.user).values_list('university_id', flat=True))
+        cache.set(key, ids, settings.FAVORITES_CACHE_TIMEOUT)
+    return ids
+
+
+def add_favorites(user, university_ids):
+    """Favorite the given universities in one insert; returns (rows added, ids that don't exist)."""
+    wanted = set(university_ids)
+    found = set(University.objects.filter(id__in=wanted).values_list('id', flat=True))
+
+    # Count around the insert: ignore_conflicts hides which rows already existed
+    existing = FavoriteUniversity.objects.filter(user=user)
+    before = existing.count()
+    FavoriteUniversity.objects.bulk_create(
+        [FavoriteUniversity(user=user, university_id=uni_id) for uni_id in found], ignore_conflicts=True
+    )
+    added = existing.count() - before
+    if added:
+        versions.bump_favorites(user.pk)
+    return added, sorted(wanted - found)
+
+
+def remove_favorites(user, university_ids):
+    """Unfavorite the given universities in one delete; returns the number removed."""
+    removed, _ = FavoriteUniversity.objects.filter(user=user, university_id__in=set(university_ids)).delete()
+    if removed:
+        versions.bump_favorites(user.pk)
+    return removed
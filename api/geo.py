@@ -0,0 +1,83 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 12
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def geohash_for(lat, lng):
+    if lat is None or lng is None:
+        return None
+    return geohash_encode(lat, lng)
+
+
+def cell_size(precision):
+    """(lat, lng) span in degrees of a geohash cell."""
+    lng_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision - lng_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def degrees_for_km(km):
+    """Angle in degrees subtended by `km` along a great circle."""
+    return math.degrees(km / EARTH_RADIUS_KM)
+
+
+def covering_cells(lat, lng, radius_km):
+    """Geohash prefixes whose cells together cover the circle around (lat, lng).
+
+    Picks the finest precision whose cells are at least as tall and wide as the
+    circle's half extents, then returns the centre cell and its eight neighbours.
+    Returns [''] (every row) when the circle reaches a pole or is too wide.
+    """
+    dlat_deg = degrees_for_km(radius_km)
+    if abs(lat) + dlat_deg >= 90.0:
+        return [""]
+    # Widest longitude offset of the circle (spherical cap), not its width at the centre
+    sin_ratio = math.sin(math.radians(dlat_deg)) / math.cos(math.radians(lat))
+    if sin_ratio >= 1.0:
+        return [""]
+    dlng_deg = math.degrees(math.asin(sin_ratio))
+
+    for p in range(GEOHASH_PRECISION, 0, -1):
+        dlat, dlng = cell_size(p)
+        if dlat >= dlat_deg and dlng >= dlng_deg:
+            break
+    else:
+        return [""]
+
+    cells = set()
+    for i in (-1, 0, 1):
+        for j in (-1, 0, 1):
+            nlat = min(max(lat + i * dlat, -90.0), 90.0)
+            nlng = (lng + j * dlng + 180.0) % 360.0 - 180.0
+            cells.add(geohash_encode(nlat, nlng, p))
+    return sorted(cells)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
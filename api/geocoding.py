@@ -0,0 +1,249 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .countries import normalize_country
+from .models import GeocodeCacheEntry, GeocodeJob
+from .ratelimit import nominatim_limiter
+from . import upstream
+
+
+def build_query(name, state_province, country):
+    return f"{name} {state_province or ''} {country}".strip()
+
+
+def normalize_query(query):
+    return " ".join(query.casefold().split())[:512]
+
+
+def _nominatim_params(query, extra_params):
+    return {
+        "q": query,
+        "format": "json",
+        "limit": 1,
+        "addressdetails": 1,
+        **extra_params,
+    }
+
+
+def _first_match(data):
+    if not data:
+        return None
+
+    result = data[0]
+    return {
+        "lat": float(result.get("lat")),
+        "lng": float(result.get("lon")),
+        "display_name": result.get("display_name", ""),
+    }
+
+
+def nominatim_search(query, timeout=5, **extra_params):
+    """Return the first Nominatim match for `query`, or None if nothing was found.
+
+    Network and HTTP errors are raised as requests.RequestException so callers
+    can tell a miss apart from an upstream failure.
+    """
+    nominatim_limiter.acquire()
+    response = upstream.get(settings.NOMINATIM_URL, params=_nominatim_params(query, extra_params), headers={
+        'User-Agent': settings.NOMINATIM_USER_AGENT  # Required by Nominatim
+    }, timeout=timeout)
+    response.raise_for_status()
+    return _first_match(response.json())
+
+
+async def anominatim_search(query, timeout=5, **extra_params):
+    """Async nominatim_search(), sharing its rate limiter and upstream breaker."""
+    await nominatim_limiter.aacquire()
+    response = await upstream.aget(settings.NOMINATIM_URL, params=_nominatim_params(query, extra_params), headers={
+        'User-Agent': settings.NOMINATIM_USER_AGENT
+    }, timeout=timeout)
+    upstream.raise_for_status(response)
+    return _first_match(response.json())
+
+
+# --------------------------
+# Geocode cache (LRU -> GeocodeCacheEntry -> Nominatim)
+# --------------------------
+_MISS = object()  # cached "Nominatim has no match"
+
+
+class _LRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= timezone.now():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_lru = _LRU(settings.GEOCODE_LRU_SIZE)
+
+
+def _ttl_expiry(seconds):
+    return timezone.now() + timedelta(seconds=seconds) if seconds else None
+
+
+def _from_entry(entry):
+    # Cache the table row in the LRU; None if it has expired
+    if entry.expires_at is not None and entry.expires_at <= timezone.now():
+        return None
+    value = {"lat": entry.lat, "lng": entry.lng, "display_name": entry.display_name} if entry.found else _MISS
+    _lru.set(entry.key, value, entry.expires_at)
+    return value
+
+
+def cached_geocode(query):
+    """Look `query` up in the LRU and the cache table only.
+
+    Returns (hit, result); result is None for a cached miss.
+    """
+    key = normalize_query(query)
+
+    value = _lru.get(key)
+    if value is None:
+        entry = GeocodeCacheEntry.objects.filter(key=key).first()
+        value = entry and _from_entry(entry)
+    if value is not None:
+        return True, (None if value is _MISS else value)
+
+    return False, None
+
+
+def cached_geocodes(queries):
+    """cached_geocode() for many queries, reading the table in one query.
+
+    Returns {query: result} for the queries that were cached (result None for a miss).
+    """
+    keys = {query: normalize_query(query) for query in queries}
+    values = {key: _lru.get(key) for key in set(keys.values())}
+    unknown = [key for key, value in values.items() if value is None]
+    if unknown:
+        for entry in GeocodeCacheEntry.objects.filter(key__in=unknown):
+            values[entry.key] = _from_entry(entry)
+    return {
+        query: (None if values[key] is _MISS else values[key])
+        for query, key in keys.items()
+        if values[key] is not None
+    }
+
+
+def geocode(query, timeout=5):
+    """Cached Nominatim lookup: returns {"lat", "lng", "display_name"} or None.
+
+    Both matches and misses are remembered (misses for GEOCODE_NEGATIVE_TTL);
+    upstream errors are not cached and propagate as requests.RequestException.
+    """
+    hit, result = cached_geocode(query)
+    if hit:
+        return result
+
+    result = nominatim_search(query, timeout=timeout)
+    store_result(query, result)
+    return result
+
+
+_geocode_slots = {}  # event loop -> asyncio.Semaphore
+
+
+def _slots():
+    loop = asyncio.get_running_loop()
+    for other in [other for other in _geocode_slots if other.is_closed()]:
+        del _geocode_slots[other]
+    if loop not in _geocode_slots:
+        _geocode_slots[loop] = asyncio.Semaphore(settings.ASYNC_GEOCODE_CONCURRENCY)
+    return _geocode_slots[loop]
+
+
+async def ageocode(query, timeout=5):
+    """Async geocode(): at most ASYNC_GEOCODE_CONCURRENCY lookups wait on Nominatim per process."""
+    hit, result = await sync_to_async(cached_geocode)(query)
+    if hit:
+        return result
+
+    async with _slots():
+        result = await anominatim_search(query, timeout=timeout)
+    await sync_to_async(store_result)(query, result)
+    return result
+
+
+def store_result(query, result):
+    key = normalize_query(query)
+    expires_at = _ttl_expiry(settings.GEOCODE_CACHE_TTL if result else settings.GEOCODE_NEGATIVE_TTL)
+    GeocodeCacheEntry.objects.update_or_create(key=key, defaults={
+        "query": query[:512],
+        "found": bool(result),
+        "lat": result["lat"] if result else None,
+        "lng": result["lng"] if result else None,
+        "display_name": result["display_name"] if result else "",
+        "expires_at": expires_at,
+    })
+    _lru.set(key, result or _MISS, expires_at)
+
+
+# --------------------------
+# Background geocoding queue
+# --------------------------
+def enqueue_geocode(universities, queries):
+    """Queue a geocode job for every university that has no coordinates yet.
+
+    `queries` maps university name -> Nominatim query string.
+    """
+    jobs = [
+        GeocodeJob(
+            university=uni,
+            country=uni.country_key,
+            query=queries.get(uni.name) or build_query(uni.name, "", uni.country),
+        )
+        for uni in universities
+        if uni.lat is None or uni.lng is None
+    ]
+    GeocodeJob.objects.bulk_create(jobs, ignore_conflicts=True)
+    return len(jobs)
+
+
+def geocode_progress(country):
+    counts = GeocodeJob.objects.filter(country=normalize_country(country)).aggregate(
+        total=Count('id'),
+        done=Count('id', filter=Q(status=GeocodeJob.STATUS_DONE)),
+        failed=Count('id', filter=Q(status=GeocodeJob.STATUS_FAILED)),
+    )
+    counts['pending'] = counts['total'] - counts['done'] - counts['failed']
+    return counts
+
+
+def with_progress(country, data):
+    """Wrap a country's list payload in the geocoding envelope while jobs are pending."""
+    progress = geocode_progress(country)
+    if not progress['pending']:
+        return data
+    if isinstance(data, dict):  # already a paginated envelope
+        return {"status": "geocoding", "progress": progress, **data}
+    return {"status": "geocoding", "progress": progress, "results": data}
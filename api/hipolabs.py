@@ -0,0 +1,69 @@
+import json
+
+from django.conf import settings
+
+from . import upstream
+
+
+def fetch_country(country, timeout=10):
+    """Return the raw Hipolabs rows for `country` (raises requests.RequestException)."""
+    response = upstream.get(settings.HIPOLABS_URL, params={"country": country}, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+async def afetch_country(country, timeout=10):
+    """Async fetch_country() (raises requests.RequestException)."""
+    response = await upstream.aget(settings.HIPOLABS_URL, params={"country": country}, timeout=timeout)
+    upstream.raise_for_status(response)
+    return response.json()
+
+
+def iter_dump(fp, chunk_size=1 << 16):
+    """Yield rows from a `world_universities_and_domains.json` style file.
+
+    The top-level JSON array is decoded incrementally, so memory stays bounded
+    by `chunk_size` plus one row no matter how large the file is.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos = "", 0
+    started = eof = False
+
+    while True:
+        while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ",")):
+            pos += 1
+
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Unexpected end of file: JSON array is not closed")
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("Expected a JSON array of universities")
+            started = True
+            pos += 1
+            continue
+
+        if buf[pos] == "]":
+            return
+        if buf[pos] != "{":
+            # Only objects are rows; scalars would also be cut short at a chunk boundary
+            raise ValueError(f"Expected a JSON object for each university, got {buf[pos:pos + 20]!r}")
+
+        try:
+            row, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The row straddles the chunk boundary; read more and retry
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+
+        yield row
+        pos = end
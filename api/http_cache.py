@@ -0,0 +1,95 @@
+import hashlib
+import re
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import has_vary_header
+from django.views.decorators.http import condition
+
+from .countries import normalize_country
+from .favorites import favorites_version
+from . import versions
+
+
+def request_version(request, default_country=None):
+    """Data version the response to `request` depends on: its country's, or the whole table's.
+
+    Read once per request: the ETag, Last-Modified and cache key all use it.
+    """
+    country = request.GET.get('country', default_country)
+    country_key = normalize_country(country) if country else None
+    seen = request.__dict__.setdefault('_data_versions', {})
+    if country_key not in seen:
+        seen[country_key] = versions.current_version(country_key)
+    return seen[country_key]
+
+
+def request_fingerprint(request, version, *extra):
+    # Accept matters because DRF may negotiate the browsable API instead of JSON
+    parts = [request.get_host(), request.path, request.GET.urlencode(), request.META.get('HTTP_ACCEPT', ''), str(version), *map(str, extra)]
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def versioned(default_country=None, cache_responses=True, vary_on_user=False):
+    """Conditional GET plus a rendered-response cache, both keyed by the data version.
+
+    The ETag and Last-Modified are derived from the cached data version only, so a
+    matching If-None-Match is answered with 304 before the view (and the DB) runs.
+    Cached bodies are keyed by the same fingerprint, so a write, which bumps the
+    version, makes every older entry unreachable.
+    """
+    def fingerprint(request):
+        # Per-user pages also change when the user's favorites do
+        extra = [request.user.pk, favorites_version(request)] if vary_on_user else []
+        return request_fingerprint(request, request_version(request, default_country), *extra)
+
+    def etag_func(request, *args, **kwargs):
+        return fingerprint(request)
+
+    def last_modified_func(request, *args, **kwargs):
+        version = request_version(request, default_country)
+        return datetime.fromtimestamp(version / 1e9, tz=dt_timezone.utc)
+
+    def decorator(view):
+        @wraps(view)
+        def cached_view(request, *args, **kwargs):
+            if not cache_responses or request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            key = f'response:{fingerprint(request)}'
+            hit = cache.get(key)
+            if hit is not None:
+                content, content_type = hit
+                return HttpResponse(content, content_type=content_type)
+
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+            content_type = response.get('Content-Type', '')
+            # Only plain JSON is shared; the browsable API embeds per-user HTML, and
+            # the key ignores Accept-Encoding (snapshots are cached by api/snapshots.py)
+            if (
+                response.status_code == 200
+                and not response.streaming
+                and content_type.startswith('application/json')
+                and not has_vary_header(response, 'Accept-Encoding')
+            ):
+                cache.set(key, (response.content, content_type), settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(cached_view)
+
+        @wraps(view)
+        def versioned_view(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            # The gzipped and plain bodies share one ETag, so mark it weak (as GZipMiddleware does)
+            if response.has_header('Content-Encoding') and response.has_header('ETag'):
+                response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+            return response
+
+        return versioned_view
+
+    return decorator
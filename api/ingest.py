@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+
+from .countries import normalize_country
+from .geo import geohash_for
+from .geocoding import build_query, enqueue_geocode
+from .models import University
+from . import versions
+
+
+@dataclass
+class IngestResult:
+    country: str
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+
+def ingest_country(country, rows, batch_size=None):
+    """Bulk upsert `rows` ({"name", "lat", "lng"} dicts) for one country.
+
+    Existing (name, country) keys are read in a single query; new names are
+    inserted with bulk_create and rows whose coordinates changed are written
+    with bulk_update, all inside one transaction.
+    """
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    country_key = normalize_country(country)
+
+    incoming = {}
+    for row in rows:
+        name = row.get("name")
+        if name:
+            incoming[name] = row
+
+    result = IngestResult(country=country)
+
+    with transaction.atomic():
+        existing_qs = University.objects.filter(country_key=country_key)
+        if len(incoming) <= batch_size:
+            # Small (streamed) batches only need their own names, not the whole country
+            existing_qs = existing_qs.filter(name__in=list(incoming))
+        existing = {uni.name: uni for uni in existing_qs.only('id', 'name', 'lat', 'lng')}
+
+        to_create = []
+        to_update = []
+        for name, row in incoming.items():
+            lat, lng = row.get("lat"), row.get("lng")
+            uni = existing.get(name)
+            if uni is None:
+                # Prefer Hipolabs' own spelling of the country over the caller's (e.g. a raw query param)
+                display = row.get("country") if normalize_country(row.get("country")) == country_key else country
+                to_create.append(University(
+                    name=name, country=display, country_key=country_key,
+                    lat=lat, lng=lng, geohash=geohash_for(lat, lng),
+                ))
+            elif lat is not None and lng is not None and (uni.lat, uni.lng) != (lat, lng):
+                uni.lat, uni.lng, uni.geohash = lat, lng, geohash_for(lat, lng)
+                to_update.append(uni)
+            else:
+                result.unchanged += 1
+
+        # ignore_conflicts skips rows inserted concurrently by another loader, so the
+        # rows actually added are counted around the insert rather than assumed
+        created_qs = University.objects.filter(country_key=country_key)
+        if len(to_create) <= batch_size:
+            created_qs = created_qs.filter(name__in=[uni.name for uni in to_create])
+        before = created_qs.count() if to_create else 0
+        University.objects.bulk_create(to_create, batch_size=batch_size, ignore_conflicts=True)
+        result.created = created_qs.count() - before if to_create else 0
+
+        University.objects.bulk_update(to_update, ['lat', 'lng', 'geohash'], batch_size=batch_size)
+        result.updated = len(to_update)
+
+        if result.created or to_update:
+            transaction.on_commit(lambda: versions.bump([country_key]))
+
+    return result
+
+
+def ingest_rows(rows, batch_size=None):
+    """Ingest rows that carry their own "country" key, one transaction per country.
+
+    Returns a list of IngestResult, one per country present in `rows`.
+    """
+    by_country = {}
+    for row in rows:
+        country = row.get("country")
+        if country:
+            by_country.setdefault(normalize_country(country), []).append(row)
+
+    return [ingest_country(country_rows[0]["country"], country_rows, batch_size=batch_size) for country_rows in by_country.values()]
+
+
+def ingest_fetched(country, data):
+    """Save freshly fetched Hipolabs rows and queue geocoding for those without coordinates."""
+    result = ingest_country(country, data)
+    queries = {
+        uni.get("name"): build_query(uni.get("name"), uni.get("state-province", ""), country)
+        for uni in data
+    }
+    enqueue_geocode(
+        University.objects.filter(country_key=normalize_country(country), lat__isnull=True), queries
+    )
+    return result
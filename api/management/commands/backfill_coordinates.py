@@ -0,0 +1,151 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Max, Min, Q
+from django.utils import timezone
+import requests
+
+from api.clusters import rebuild_clusters
+from api.geo import geohash_for
+from api.geocoding import build_query, geocode
+from api.models import BackfillCheckpoint, GeocodeJob, University
+from api.upstream import CircuitOpenError
+from api import versions
+
+
+class Command(BaseCommand):
+    help = 'Geocode universities without coordinates, in id order, resuming from a checkpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Rows geocoded per checkpoint')
+        parser.add_argument('--from-id', type=int, help='First university id of this shard')
+        parser.add_argument('--to-id', type=int, help='Shard end (exclusive); default: no upper bound')
+        parser.add_argument('--shard', type=int, help='Take shard K (1-based) of --shards equal id ranges')
+        parser.add_argument('--shards', type=int, help='Number of shards, one process each')
+        parser.add_argument('--name', help='Checkpoint name (default: derived from the shard)')
+        parser.add_argument('--reset', action='store_true', help='Start the shard over, retrying rows already tried')
+
+    def handle(self, *args, **options):
+        checkpoint = self.checkpoint(options)
+        if checkpoint.finished_at and not options['reset']:
+            self.stdout.write(f'Backfill "{checkpoint.name}" already finished; use --reset to run it again')
+            return
+        if options['reset']:
+            BackfillCheckpoint.objects.filter(name=checkpoint.name).update(
+                last_id=checkpoint.from_id - 1, processed=0, located=0, not_found=0, failed=0, finished_at=None
+            )
+            checkpoint.refresh_from_db()
+
+        self.stdout.write(
+            f'Backfill "{checkpoint.name}": ids {checkpoint.from_id} to {checkpoint.to_id or "end"}, '
+            f'resuming after id {checkpoint.last_id}'
+        )
+        countries = set()
+        # Nominatim calls are paced by the shared rate limiter in api.geocoding, so
+        # every shard and the geocode worker draw from one budget
+        while batch := self.next_batch(checkpoint, options['batch_size']):
+            countries |= self.process(checkpoint, batch)
+
+        BackfillCheckpoint.objects.filter(name=checkpoint.name).update(finished_at=timezone.now())
+        for country_key in sorted(countries):
+            rebuild_clusters(country_key, wait=settings.CLUSTER_REBUILD_LOCK_TIMEOUT)
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfill "{checkpoint.name}" finished: {checkpoint.located} located, '
+            f'{checkpoint.not_found} not found, {checkpoint.failed} failed'
+        ))
+
+    def checkpoint(self, options):
+        """The checkpoint row of this shard; its id range is fixed when it is first created."""
+        if (options['shard'] is None) != (options['shards'] is None):
+            raise CommandError('--shard and --shards go together')
+
+        if options['shards']:
+            if not 1 <= options['shard'] <= options['shards']:
+                raise CommandError(f'--shard must be between 1 and {options["shards"]}')
+            name = options['name'] or f'shard-{options["shard"]}-of-{options["shards"]}'
+            existing = BackfillCheckpoint.objects.filter(name=name).first()
+            if existing:
+                return existing
+            bounds = University.objects.aggregate(low=Min('id'), high=Max('id'))
+            low, high = bounds['low'] or 0, bounds['high'] or 0
+            size = math.ceil((high - low + 1) / options['shards'])
+            from_id = low + (options['shard'] - 1) * size
+            # The last shard is open-ended, so rows added later are still covered
+            to_id = None if options['shard'] == options['shards'] else from_id + size
+        else:
+            from_id, to_id = options['from_id'] or 0, options['to_id']
+            name = options['name'] or f'range-{from_id}-{to_id or "end"}'
+
+        checkpoint, _ = BackfillCheckpoint.objects.get_or_create(
+            name=name, defaults={"from_id": from_id, "to_id": to_id, "last_id": from_id - 1}
+        )
+        return checkpoint
+
+    def next_batch(self, checkpoint, batch_size):
+        queryset = (
+            University.objects.filter(Q(lat__isnull=True) | Q(lng__isnull=True), id__gt=checkpoint.last_id)
+            # Rows the geocode worker is about to do are left to it
+            .exclude(geocode_job__status__in=(GeocodeJob.STATUS_PENDING, GeocodeJob.STATUS_RUNNING))
+            .annotate(job_query=F('geocode_job__query'))
+            .only('id', 'name', 'country', 'country_key')
+            .order_by('id')
+        )
+        if checkpoint.to_id is not None:
+            queryset = queryset.filter(id__lt=checkpoint.to_id)
+        return list(queryset[:batch_size])
+
+    def process(self, checkpoint, batch):
+        """Geocode `batch` and store the results with the checkpoint; returns the countries changed."""
+        located, not_found, failed = [], 0, 0
+        last_id = checkpoint.last_id
+        for uni in batch:
+            # The queued query keeps the state/province Hipolabs gave, which University doesn't store
+            query = uni.job_query or build_query(uni.name, "", uni.country)
+            try:
+                result = geocode(query)
+            except CircuitOpenError:
+                # Store what is done and retry from the first row not yet tried
+                self.stderr.write(f'Nominatim unavailable, pausing {settings.UPSTREAM_BREAKER_RESET:.0f}s')
+                self.save(checkpoint, last_id, located, not_found, failed)
+                time.sleep(settings.UPSTREAM_BREAKER_RESET)
+                return {uni.country_key for uni in located}
+            except (requests.RequestException, ValueError) as e:
+                self.stderr.write(f'Geocoding failed for "{query}": {e}')
+                failed += 1
+            else:
+                if result:
+                    uni.lat, uni.lng = result['lat'], result['lng']
+                    uni.geohash = geohash_for(uni.lat, uni.lng)
+                    located.append(uni)
+                else:
+                    not_found += 1
+            last_id = uni.id
+
+        self.save(checkpoint, last_id, located, not_found, failed)
+        self.stdout.write(
+            f'  up to id {last_id}: {checkpoint.located} located, {checkpoint.not_found} not found, '
+            f'{checkpoint.failed} failed'
+        )
+        return {uni.country_key for uni in located}
+
+    def save(self, checkpoint, last_id, located, not_found, failed):
+        """Write the coordinates found and move the checkpoint past them, in one transaction."""
+        with transaction.atomic():
+            University.objects.bulk_update(located, ['lat', 'lng', 'geohash'])
+            # Failed jobs of rows located here no longer count as failures in the progress envelope
+            GeocodeJob.objects.filter(university__in=located).update(
+                status=GeocodeJob.STATUS_DONE, last_error='', updated_at=timezone.now()
+            )
+            checkpoint.last_id = last_id
+            checkpoint.processed += len(located) + not_found + failed
+            checkpoint.located += len(located)
+            checkpoint.not_found += not_found
+            checkpoint.failed += failed
+            checkpoint.save()
+            countries = {uni.country_key for uni in located}
+            if countries:
+                # bulk_update skips the post_save signal
+                transaction.on_commit(lambda: versions.bump(countries))
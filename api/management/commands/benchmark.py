@@ -0,0 +1,94 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from api.benchmark import compare, run_suite
+from api.stubs import StubUpstream
+
+class Command(BaseCommand):
+    help = 'Benchmark every endpoint and load command against seeded data and local upstream stubs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 100000, 1000000],
+                            help='Dataset sizes (universities) to seed and measure, smallest first')
+        parser.add_argument('--requests', type=int, default=50, help='Timed calls per endpoint')
+        parser.add_argument('--latency', type=float, default=50.0, help='Stub upstream latency in ms')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Extra random stub latency, up to this many ms')
+        parser.add_argument('--failure-rate', type=float, default=0.0,
+                            help='Share of stub upstream responses that are 503s (0-1)')
+        parser.add_argument('--rows-per-country', type=int, default=50,
+                            help='Universities the Hipolabs stub returns per country')
+        parser.add_argument('--nominatim-rate', type=float, default=0,
+                            help='Nominatim requests/s during the run (0 disables the limiter)')
+        parser.add_argument('--output', type=str, help='Result file (default: benchmarks/<timestamp>.json)')
+        parser.add_argument('--compare', type=str, metavar='FILE', help='Print p50/p99 ratios against an earlier run')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the benchmark database between runs (seeding only tops it up)')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['failure_rate'] <= 1:
+            raise CommandError('--failure-rate must be between 0 and 1')
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as fp:
+                previous = json.load(fp)
+
+        output = options['output'] or os.path.join('benchmarks', time.strftime('%Y%m%d-%H%M%S') + '.json')
+        snapshot_dir = tempfile.mkdtemp(prefix='bench-snapshots-')
+        stub = StubUpstream(
+            latency=options['latency'] / 1000, jitter=options['jitter'] / 1000,
+            failure_rate=options['failure_rate'], rows_per_country=options['rows_per_country'],
+        )
+
+        # Runs against a throwaway test database, never the configured one
+        setup_test_environment(debug=False)
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            with stub:
+                self.stdout.write(f'Benchmarking on {connection.vendor} ({connection.settings_dict["NAME"]})')
+                results = run_suite(
+                    options['sizes'], options['requests'], stub, snapshot_dir,
+                    nominatim_rate=options['nominatim_rate'], progress=self.stdout.write,
+                )
+        finally:
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+        report = {
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            "revision": self.revision(),
+            "python": platform.python_version(),
+            "database": connection.vendor,
+            "config": {
+                key: options[key] for key in (
+                    'sizes', 'requests', 'latency', 'jitter', 'failure_rate', 'rows_per_country', 'nominatim_rate'
+                )
+            },
+            "upstream_hits": stub.hits,
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+        if previous:
+            self.stdout.write(f'Compared with {options["compare"]}:')
+            for line in compare(previous, report):
+                self.stdout.write('  ' + line)
+
+    def revision(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
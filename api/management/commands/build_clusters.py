@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from api.clusters import rebuild_clusters
+from api.countries import normalize_country
+from api.models import University
+
+class Command(BaseCommand):
+    help = 'Precompute map clusters for every zoom level'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--countries', nargs='+', type=str, help='Only these countries (default: all)')
+
+    def handle(self, *args, **options):
+        if options['countries']:
+            country_keys = [normalize_country(c) for c in options['countries']]
+        else:
+            country_keys = University.objects.values_list('country_key', flat=True).distinct().order_by('country_key')
+
+        for country_key in country_keys:
+            count = rebuild_clusters(country_key)
+            if count is None:
+                self.stderr.write(f'Skipped {country_key}: another process is rebuilding it')
+            else:
+                self.stdout.write(f'Built {count} clusters for {country_key}')
+
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from api.countries import FEATURED_COUNTRIES, normalize_country
+from api.snapshots import KINDS, PAYLOADS, get_snapshot, render
+
+class Command(BaseCommand):
+    help = 'Pre-render the list and locations snapshots for the featured countries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--countries', nargs='+', type=str, default=FEATURED_COUNTRIES, help='Countries to build'
+        )
+        parser.add_argument(
+            '--bench', type=int, default=0, metavar='N',
+            help='Also time N renders through the serializer, the fast path and the snapshot'
+        )
+
+    def handle(self, *args, **options):
+        for country in options['countries']:
+            country_key = normalize_country(country)
+            for kind in KINDS:
+                started = time.monotonic()
+                snapshot = get_snapshot(kind, country_key, rebuild=True)
+                self.stdout.write(
+                    f'{country:<20} {kind:<10} {snapshot.count:>6} rows  {len(snapshot.content):>9} B  '
+                    f'{len(snapshot.gzipped):>8} B gz  {time.monotonic() - started:.3f}s'
+                )
+                if options['bench']:
+                    self.bench(kind, country_key, options['bench'])
+
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def bench(self, kind, country_key, n):
+        rates = {}
+        for label, fast in (('serializer', False), ('fast', True)):
+            started = time.perf_counter()
+            for _ in range(n):
+                payload, rows = PAYLOADS[kind](country_key, fast=fast)
+                render(payload, rows, fast=fast)
+            rates[label] = n / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(n):
+            get_snapshot(kind, country_key)
+        rates['snapshot'] = n / (time.perf_counter() - started)
+
+        base = rates['serializer']
+        self.stdout.write('    ' + '   '.join(
+            f'{label} {rate:>9.1f}/s (x{rate / base:.1f})' for label, rate in rates.items()
+        ))
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 import requests
-from api.models import University
+from api.hipolabs import fetch_country
+from api.ingest import ingest_country
 
 class Command(BaseCommand):
     help = "Fetch universities from Hipolabs API and save to DB"
@@ -9,28 +11,19 @@ class Command(BaseCommand):
         parser.add_argument(
             '--country', type=str, help='Country name to fetch universities for', required=True
         )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.INGEST_BATCH_SIZE, help='Rows per bulk insert/update'
+        )
 
     def handle(self, *args, **options):
         country = options['country']
-        url = f"http://universities.hipolabs.com/search?country={country}"
-        response = requests.get(url)
 
-        if response.status_code != 200:
-            self.stdout.write(self.style.ERROR(f"Failed to fetch data. Status: {response.status_code}"))
+        try:
+            data = fetch_country(country)
+        except requests.RequestException as e:
+            self.stdout.write(self.style.ERROR(f"Failed to fetch data: {e}"))
             return
 
-        data = response.json()
-        count = 0
-
-        for uni in data:
-            name = uni.get('name')
-            if name:
-                # Save or update to avoid duplicates
-                obj, created = University.objects.get_or_create(
-                    name=name,
-                    country=country
-                )
-                if created:
-                    count += 1
+        result = ingest_country(country, data, batch_size=options['batch_size'])
 
-        self.stdout.write(self.style.SUCCESS(f"Added {count} universities for {country}"))
+        self.stdout.write(self.style.SUCCESS(f"Added {result.created} universities for {country}"))
@@ -0,0 +1,127 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+import requests
+
+from api.clusters import rebuild_clusters
+from api.geo import geohash_for
+from api.geocoding import geocode
+from api.models import GeocodeJob, University
+from api.upstream import CircuitOpenError
+from api import versions
+
+class Command(BaseCommand):
+    help = 'Process queued geocode jobs (run as a separate worker process)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20, help='Jobs claimed per round')
+        parser.add_argument('--idle-sleep', type=float, default=5.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue running jobs not updated for this many seconds')
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Geocode worker started')
+        self.dirty = {}  # country_key -> when its first unclustered coordinates were stored
+
+        while True:
+            self.requeue_stale(options['stale_after'])
+            jobs = self.claim(options['batch_size'])
+            self.rebuild_dirty_clusters()
+
+            if not jobs:
+                if options['once']:
+                    break
+                time.sleep(options['idle_sleep'])
+                continue
+
+            # Nominatim calls are paced by the shared rate limiter in api.geocoding
+            for i, job in enumerate(jobs):
+                if not self.process(job):
+                    # Nominatim is down: hand the rest back without using up attempts
+                    self.release(jobs[i:])
+                    self.stderr.write(f'Nominatim unavailable, pausing {settings.UPSTREAM_BREAKER_RESET:.0f}s')
+                    time.sleep(settings.UPSTREAM_BREAKER_RESET)
+                    break
+
+        self.stdout.write(self.style.SUCCESS('Geocode queue drained'))
+
+    def rebuild_dirty_clusters(self):
+        """Rebuild map clusters of countries whose geocoding finished, or every CLUSTER_REBUILD_INTERVAL while it runs."""
+        if not self.dirty:
+            return
+        busy = set(GeocodeJob.objects.filter(
+            country__in=list(self.dirty), status__in=(GeocodeJob.STATUS_PENDING, GeocodeJob.STATUS_RUNNING)
+        ).values_list('country', flat=True).distinct())
+        now = time.monotonic()
+        for country_key, since in list(self.dirty.items()):
+            if country_key in busy and now - since < settings.CLUSTER_REBUILD_INTERVAL:
+                continue
+            # Skipped while another process rebuilds it; retried on the next round
+            if rebuild_clusters(country_key) is not None:
+                del self.dirty[country_key]
+
+    def requeue_stale(self, stale_after):
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        GeocodeJob.objects.filter(
+            status=GeocodeJob.STATUS_RUNNING, updated_at__lt=cutoff
+        ).update(status=GeocodeJob.STATUS_PENDING, updated_at=timezone.now())
+
+    def claim(self, batch_size):
+        # skip_locked lets several workers share the queue on Postgres
+        with transaction.atomic():
+            jobs = list(
+                GeocodeJob.objects.select_for_update(skip_locked=True)
+                .filter(status=GeocodeJob.STATUS_PENDING)
+                .order_by('id')[:batch_size]
+            )
+            GeocodeJob.objects.filter(id__in=[job.id for job in jobs]).update(
+                status=GeocodeJob.STATUS_RUNNING,
+                attempts=F('attempts') + 1,
+                updated_at=timezone.now(),
+            )
+        return jobs
+
+    def release(self, jobs):
+        GeocodeJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            status=GeocodeJob.STATUS_PENDING,
+            attempts=F('attempts') - 1,
+            updated_at=timezone.now(),
+        )
+
+    def process(self, job):
+        """Geocode one claimed job; False if it was not attempted because the circuit is open."""
+        try:
+            result = geocode(job.query)
+        except CircuitOpenError:
+            return False
+        except (requests.RequestException, ValueError) as e:
+            attempts = job.attempts + 1
+            status = GeocodeJob.STATUS_FAILED if attempts >= settings.GEOCODE_MAX_ATTEMPTS else GeocodeJob.STATUS_PENDING
+            GeocodeJob.objects.filter(id=job.id).update(status=status, last_error=str(e)[:1000], updated_at=timezone.now())
+            if status == GeocodeJob.STATUS_FAILED:
+                versions.bump([job.country])
+            self.stderr.write(f'Geocoding failed for "{job.query}": {e}')
+            return True
+
+        self.finish(job, result)
+        return True
+
+    def finish(self, job, result):
+        if result:
+            University.objects.filter(id=job.university_id).update(
+                lat=result['lat'], lng=result['lng'], geohash=geohash_for(result['lat'], result['lng'])
+            )
+            status = GeocodeJob.STATUS_DONE
+            self.dirty.setdefault(job.country, time.monotonic())
+        else:
+            status = GeocodeJob.STATUS_FAILED  # Nominatim has no match; retrying will not help
+
+        GeocodeJob.objects.filter(id=job.id).update(status=status, last_error='', updated_at=timezone.now())
+        versions.bump([job.country])  # .update() skips the post_save signal; progress changed too
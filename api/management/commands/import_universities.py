@@ -0,0 +1,65 @@
+import gzip
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.countries import normalize_country
+from api.hipolabs import iter_dump
+from api.ingest import ingest_rows
+from api.models import University
+
+class Command(BaseCommand):
+    help = 'Import universities from a local Hipolabs world_universities_and_domains.json dump (no network)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='Path to the JSON dump (.json or .json.gz)')
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.INGEST_BATCH_SIZE,
+            help='Rows parsed before each batched DB write'
+        )
+        parser.add_argument(
+            '--countries', nargs='+', type=str, help='Only import these countries'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        batch_size = options['batch_size']
+        only = {normalize_country(c) for c in options['countries']} if options['countries'] else None
+
+        opener = gzip.open if path.endswith('.gz') else open
+        started = time.monotonic()
+        seen = created = updated = 0
+
+        try:
+            with opener(path, 'rt', encoding='utf-8') as fp:
+                batch = []
+                for row in iter_dump(fp):
+                    country = row.get('country')
+                    if not row.get('name') or not country:
+                        continue
+                    if only and normalize_country(country) not in only:
+                        continue
+
+                    batch.append({'name': row['name'], 'country': country})
+                    if len(batch) >= batch_size:
+                        c, u = self.flush(batch, batch_size)
+                        seen, created, updated = seen + len(batch), created + c, updated + u
+                        batch = []
+
+                if batch:
+                    c, u = self.flush(batch, batch_size)
+                    seen, created, updated = seen + len(batch), created + c, updated + u
+        except OSError as e:
+            raise CommandError(f'Could not read {path}: {e}')
+        except ValueError as e:
+            raise CommandError(f'Invalid dump file {path}: {e}')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {seen} rows in {elapsed:.2f}s: {created} added, {updated} updated'
+        ))
+        self.stdout.write(f'Total universities in database: {University.objects.count()}')
+
+    def flush(self, batch, batch_size):
+        results = ingest_rows(batch, batch_size=batch_size)
+        return sum(r.created for r in results), sum(r.updated for r in results)
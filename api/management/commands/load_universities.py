@@ -1,6 +1,19 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Min
 import requests
+from api.clusters import rebuild_clusters
+from api.countries import FEATURED_COUNTRIES, normalize_country
+from api.geocoding import build_query, geocode
+from api.hipolabs import fetch_country
+from api.ingest import ingest_country
 from api.models import University
+from api.sync import sync_country
+from api import upstream
 
 class Command(BaseCommand):
     help = 'Load universities from Hipolabs API for specified countries'
@@ -11,68 +24,117 @@ class Command(BaseCommand):
             nargs='+',
             type=str,
             help='List of countries to load universities for',
-            default=[
-                "Philippines", "Japan", "India", "Australia",
-                "Canada", "Singapore", "Thailand", "Saudi Arabia", "United Kingdom"
-            ]
+            default=FEATURED_COUNTRIES
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.INGEST_BATCH_SIZE, help='Rows per bulk insert/update'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Countries loaded in parallel (Nominatim stays within NOMINATIM_RATE_LIMIT)'
+        )
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Skip countries unchanged since the last sync; otherwise apply only added, changed and removed rows'
+        )
+        parser.add_argument(
+            '--stored', action='store_true', help='Every country already in the database (instead of --countries)'
         )
 
     def handle(self, *args, **options):
         countries = options['countries']
+        if options['stored']:
+            countries = list(
+                University.objects.values('country_key').annotate(name=Min('country'))
+                .order_by('country_key').values_list('name', flat=True)
+            )
+        batch_size = options['batch_size']
+        self.incremental = options['incremental']
+        started = time.monotonic()
 
-        for country in countries:
-            self.stdout.write(f'Loading universities for {country}...')
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                stats = list(pool.map(lambda country: self.load_threaded(country, batch_size), countries))
+        else:
+            stats = [self.load_country(country, batch_size) for country in countries]
 
-            # Fetch from Hipolabs API
-            url = f"http://universities.hipolabs.com/search?country={country}"
-            try:
-                response = requests.get(url, timeout=10)
-                response.raise_for_status()
-                data = response.json()
-            except requests.RequestException as e:
-                self.stderr.write(f'Error fetching data for {country}: {e}')
-                continue
+        elapsed = time.monotonic() - started
+        self.report([s for s in stats if s], elapsed)
+        self.report_upstream()
 
-            universities_added = 0
+        total_universities = University.objects.count()
+        self.stdout.write(f'Total universities in database: {total_universities}')
+
+    def load_threaded(self, country, batch_size):
+        try:
+            return self.load_country(country, batch_size)
+        finally:
+            connections.close_all()  # each pool thread has its own DB connection
+
+    def load_country(self, country, batch_size):
+        self.stdout.write(f'Loading universities for {country}...')
+        started = time.monotonic()
+
+        # Fetch from Hipolabs API
+        try:
+            data = fetch_country(country)
+        except requests.RequestException as e:
+            self.stderr.write(f'Error fetching data for {country}: {e}')
+            return None
+
+        if self.incremental:
+            result = sync_country(country, data, locate=lambda uni: self.locate(uni, country), batch_size=batch_size)
+            if result.skipped:
+                self.stdout.write(f'Skipped {country}: unchanged since the last sync')
+            else:
+                self.stdout.write(
+                    f'Synced {country}: {result.created} added, {result.updated} updated, '
+                    f'{result.removed} removed, {result.unchanged} unchanged'
+                )
+            changed = result.changed
+        else:
+            rows = []
             for uni in data:
                 name = uni.get("name")
                 if name:
-                    # Get coordinates for the university
-                    state_province = uni.get("state-province", "")
-                    search_query = f"{name} {state_province} {country}".strip()
-
-                    # Get coordinates using Nominatim
-                    lat, lng = None, None
-                    try:
-                        nominatim_url = "https://nominatim.openstreetmap.org/search"
-                        params = {
-                            "q": search_query,
-                            "format": "json",
-                            "limit": 1,
-                            "addressdetails": 1
-                        }
-                        response = requests.get(nominatim_url, params=params, headers={
-                            'User-Agent': 'UniversityFinder/1.0'
-                        }, timeout=5)
-                        response.raise_for_status()
-                        nominatim_data = response.json()
-
-                        if nominatim_data:
-                            lat = float(nominatim_data[0].get("lat"))
-                            lng = float(nominatim_data[0].get("lon"))
-                    except:
-                        pass  # Continue without coordinates if geocoding fails
-
-                    obj, created = University.objects.get_or_create(
-                        name=name,
-                        country=country,
-                        defaults={'lat': lat, 'lng': lng}
-                    )
-
-                    if created:
-                        universities_added += 1
-
-            self.stdout.write(f'Added {universities_added} universities for {country}')
+                    lat, lng = self.locate(uni, country) or (None, None)
+                    rows.append({"name": name, "lat": lat, "lng": lng})
 
-        total_universities = University.objects.count()
-        self.stdout.write(f'Total universities in database: {total_universities}')
\ No newline at end of file
+            result = ingest_country(country, rows, batch_size=batch_size)
+            self.stdout.write(
+                f'Added {result.created} universities for {country} '
+                f'({result.updated} updated, {result.unchanged} unchanged)'
+            )
+            changed = result.created or result.updated
+
+        if changed:
+            rebuild_clusters(normalize_country(country), wait=settings.CLUSTER_REBUILD_LOCK_TIMEOUT)
+        return {"country": country, "rows": len(data), "seconds": time.monotonic() - started}
+
+    def locate(self, uni, country):
+        # Get coordinates for the university (cached, so reloads skip the network)
+        search_query = build_query(uni.get("name"), uni.get("state-province", ""), country)
+        try:
+            result = geocode(search_query)
+        except requests.RequestException as e:
+            self.stderr.write(f'Geocoding failed for "{search_query}": {e}')
+            return None
+        return (result["lat"], result["lng"]) if result else None
+
+    def report(self, stats, elapsed):
+        if not stats:
+            return
+        self.stdout.write('')
+        for s in stats:
+            self.stdout.write(f'  {s["country"]:<20} {s["rows"]:>6} rows  {s["seconds"]:>8.2f}s')
+        total_rows = sum(s["rows"] for s in stats)
+        rate = total_rows / elapsed if elapsed else 0
+        self.stdout.write(f'Loaded {total_rows} rows in {elapsed:.2f}s ({rate:.1f} rows/s)')
+
+    def report_upstream(self):
+        for host, s in upstream.stats().items():
+            self.stdout.write(
+                f'  {host:<40} {s["requests"]:>6} calls  {s["errors"]:>4} errors  '
+                f'{s["short_circuited"]:>4} short-circuited  p50 {s["p50_ms"]} ms  p99 {s["p99_ms"]} ms  '
+                f'breaker {s["breaker"]}'
+            )
@@ -0,0 +1,247 @@
+import bisect
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 1000)
+SLOWEST_QUERIES = 5  # kept per request for the slow-request log
+SQL_PREVIEW = 300  # characters of each of those queries that get logged
+
+# name -> (type, help, buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests per route, method and status.', None),
+    'http_request_duration_seconds': ('histogram', 'Wall time per request, streamed bodies included.', SECONDS_BUCKETS),
+    'http_request_db_queries': ('histogram', 'DB queries per request.', QUERY_BUCKETS),
+    'http_request_db_duration_seconds': ('histogram', 'Time per request spent in DB queries.', SECONDS_BUCKETS),
+    'http_request_serialization_seconds': ('histogram', 'Time per request spent encoding responses.', SECONDS_BUCKETS),
+    'http_request_upstream_seconds': ('histogram', 'Time per request spent on outbound HTTP, by upstream host.', SECONDS_BUCKETS),
+    'upstream_request_duration_seconds': ('histogram', 'Outbound HTTP calls (retries included), by upstream host.', SECONDS_BUCKETS),
+    'autocomplete_index_bytes': ('gauge', 'Memory held by the autocomplete index of this process.', None),
+    'autocomplete_index_rows': ('gauge', 'Universities in the autocomplete index of this process.', None),
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the shape Prometheus expects (le = upper bound, inclusive)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip((*self.buckets, float('inf')), self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry:
+    """In-process metrics; each worker process exposes its own."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}  # (name, labels) -> Histogram, or a number for counters and gauges
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._series:
+                self._series[key] = Histogram(METRICS[name][2])
+            self._series[key].observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._series[(name, tuple(sorted(labels.items())))] = value
+
+    def get(self, name, **labels):
+        return self._series.get((name, tuple(sorted(labels.items()))))
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        """The Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            series = sorted(
+                (key, value if isinstance(value, (int, float)) else (list(value.cumulative()), value.sum, value.count))
+                for key, value in self._series.items()
+            )
+
+        lines, seen = [], set()
+        for (name, labels), value in series:
+            kind, help_text, _ = METRICS[name]
+            if name not in seen:
+                seen.add(name)
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            if kind in ('counter', 'gauge'):
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            buckets, total, count = value
+            for bound, cumulative in buckets:
+                lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+registry = Registry()
+
+
+# --------------------------
+# Per-request breakdown
+# --------------------------
+class RequestMetrics:
+    def __init__(self, keep_queries=False):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.serialization_time = 0.0
+        self.upstream = {}  # host -> seconds
+        self.slowest = [] if keep_queries else None  # min-heap of (seconds, sql)
+        self._serializing = False
+
+    def add_query(self, sql, elapsed):
+        self.queries += 1
+        self.query_time += elapsed
+        if self.slowest is not None:
+            entry = (elapsed, sql[:SQL_PREVIEW])
+            if len(self.slowest) < SLOWEST_QUERIES:
+                heapq.heappush(self.slowest, entry)
+            elif entry > self.slowest[0]:
+                heapq.heapreplace(self.slowest, entry)
+
+
+# contextvars, so queries run through sync_to_async are counted for the request that started them
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def start(keep_queries=False):
+    return _current.set(RequestMetrics(keep_queries))
+
+
+def current():
+    return _current.get()
+
+
+def stop(token):
+    metrics = _current.get()
+    _current.reset(token)
+    return metrics
+
+
+@contextmanager
+def activate(metrics):
+    """Count work done while iterating a streamed body against the request it belongs to."""
+    token = _current.set(metrics)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def db_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    """connection_created receiver: the wrapper stays on every connection of every thread.
+
+    connection.execute_wrapper() would only cover the middleware's own thread,
+    not the threads async views run their queries in.
+    """
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_wrapper)
+
+
+@contextmanager
+def serialization():
+    """Time response encoding; nested calls (a renderer inside a serializer) count once."""
+    metrics = _current.get()
+    if metrics is None or metrics._serializing:
+        yield
+        return
+    metrics._serializing = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialization_time += time.perf_counter() - started
+        metrics._serializing = False
+
+
+def record_upstream(host, elapsed):
+    registry.observe('upstream_request_duration_seconds', elapsed, host=host)
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.upstream[host] = metrics.upstream.get(host, 0.0) + elapsed
+
+
+def record_request(metrics, route, method, status, slow_ms=0, path=''):
+    elapsed = time.perf_counter() - metrics.started
+    registry.inc('http_requests_total', route=route, method=method, status=str(status))
+    registry.observe('http_request_duration_seconds', elapsed, route=route, method=method)
+    registry.observe('http_request_db_queries', metrics.queries, route=route)
+    registry.observe('http_request_db_duration_seconds', metrics.query_time, route=route)
+    registry.observe('http_request_serialization_seconds', metrics.serialization_time, route=route)
+    for host, seconds in metrics.upstream.items():
+        registry.observe('http_request_upstream_seconds', seconds, route=route, host=host)
+
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        logger.warning('Slow request: %s', breakdown(metrics, elapsed, f'{method} {path or route} -> {status}'))
+    return elapsed
+
+
+def breakdown(metrics, elapsed, label):
+    upstream = ', '.join(f'{host} {seconds * 1000:.1f} ms' for host, seconds in sorted(metrics.upstream.items()))
+    other = elapsed - metrics.query_time - metrics.serialization_time - sum(metrics.upstream.values())
+    lines = [
+        f'{label} took {elapsed * 1000:.1f} ms: {metrics.queries} queries {metrics.query_time * 1000:.1f} ms, '
+        f'serialization {metrics.serialization_time * 1000:.1f} ms, upstream {upstream or "none"}, '
+        f'other {max(other, 0) * 1000:.1f} ms'
+    ]
+    for seconds, sql in sorted(metrics.slowest or (), reverse=True):
+        lines.append(f'  {seconds * 1000:8.1f} ms  {sql}')
+    return '\n'.join(lines)
@@ -0,0 +1,80 @@
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from . import metrics
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    return f'/{match.route}' if match else 'unmatched'
+
+
+def _finish(request, response, request_metrics):
+    """Record the request now, or once its streamed body has been sent."""
+    def record():
+        metrics.record_request(
+            request_metrics, route_of(request), request.method, response.status_code,
+            slow_ms=settings.SLOW_REQUEST_MS, path=request.path,
+        )
+
+    if not response.streaming:
+        record()
+        return response
+
+    content = response.streaming_content
+    # Queries and encoding done by the body's generator count for this request
+    if response.is_async:
+        async def stream():
+            iterator = aiter(content)
+            try:
+                while True:
+                    with metrics.activate(request_metrics):
+                        try:
+                            chunk = await anext(iterator)
+                        except StopAsyncIteration:
+                            break
+                    yield chunk
+            finally:
+                record()
+    else:
+        def stream():
+            iterator = iter(content)
+            try:
+                while True:
+                    with metrics.activate(request_metrics):
+                        try:
+                            chunk = next(iterator)
+                        except StopIteration:
+                            break
+                    yield chunk
+            finally:
+                record()
+    response.streaming_content = stream()
+    return response
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """Per-route wall time, DB queries, serialization and upstream time (api/metrics.py)."""
+    if not settings.METRICS_ENABLED:
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = metrics.start(keep_queries=bool(settings.SLOW_REQUEST_MS))
+            try:
+                response = await get_response(request)
+            finally:
+                request_metrics = metrics.stop(token)
+            return _finish(request, response, request_metrics)
+    else:
+        def middleware(request):
+            token = metrics.start(keep_queries=bool(settings.SLOW_REQUEST_MS))
+            try:
+                response = get_response(request)
+            finally:
+                request_metrics = metrics.stop(token)
+            return _finish(request, response, request_metrics)
+    return middleware
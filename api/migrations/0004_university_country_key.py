@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_geocodecacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='university',
+            name='country_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+            preserve_default=False,
+        ),
+    ]
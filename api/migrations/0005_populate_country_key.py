@@ -0,0 +1,53 @@
+from django.db import migrations
+
+
+def normalize_country(country):
+    # Frozen copy of api.countries.normalize_country
+    return " ".join((country or "").casefold().split())
+
+
+def populate_country_key(apps, schema_editor):
+    University = apps.get_model('api', 'University')
+    FavoriteUniversity = apps.get_model('api', 'FavoriteUniversity')
+    GeocodeJob = apps.get_model('api', 'GeocodeJob')
+
+    # Merge rows that only differed by the case of their country ("philippines" vs "Philippines"),
+    # keeping the oldest row that has coordinates, or else the oldest row.
+    groups = {}
+    for uni in University.objects.order_by('id').iterator():
+        uni.country_key = normalize_country(uni.country)
+        groups.setdefault((uni.country_key, uni.name), []).append(uni)
+
+    keep = []
+    duplicates = {}
+    for rows in groups.values():
+        kept = next((uni for uni in rows if uni.lat is not None), rows[0])
+        keep.append(kept)
+        for uni in rows:
+            if uni is not kept:
+                duplicates[uni.id] = kept
+
+    for dup_id, kept in duplicates.items():
+        favorited = set(FavoriteUniversity.objects.filter(university_id=kept.id).values_list('user_id', flat=True))
+        FavoriteUniversity.objects.filter(university_id=dup_id, user_id__in=favorited).delete()
+        FavoriteUniversity.objects.filter(university_id=dup_id).update(university_id=kept.id)
+        GeocodeJob.objects.filter(university_id=dup_id).delete()
+    University.objects.filter(id__in=list(duplicates)).delete()
+
+    University.objects.bulk_update(keep, ['country_key'], batch_size=500)
+
+    jobs = list(GeocodeJob.objects.all())
+    for job in jobs:
+        job.country = normalize_country(job.country)
+    GeocodeJob.objects.bulk_update(jobs, ['country'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_university_country_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_country_key, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_populate_country_key'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='university',
+            unique_together={('country_key', 'name')},
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:56
+
+from django.db import migrations, models
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_for(lat, lng, precision=12):
+    # Frozen copy of api.geo.geohash_for
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def populate_geohash(apps, schema_editor):
+    University = apps.get_model('api', 'University')
+    batch = []
+    for uni in University.objects.filter(lat__isnull=False, lng__isnull=False).only('id', 'lat', 'lng').iterator():
+        uni.geohash = geohash_for(uni.lat, uni.lng)
+        batch.append(uni)
+        if len(batch) >= 1000:
+            University.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    University.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_alter_university_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='university',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(populate_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_university_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UniversityCluster',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country_key', models.CharField(max_length=100)),
+                ('zoom', models.PositiveSmallIntegerField()),
+                ('cell_x', models.IntegerField()),
+                ('cell_y', models.IntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('lat', models.FloatField()),
+                ('lng', models.FloatField()),
+                ('university', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.university')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['country_key', 'count', 'lat'], name='api_univers_country_8d34dc_idx')],
+                'unique_together': {('country_key', 'zoom', 'cell_x', 'cell_y')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_universitycluster'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='university',
+            index=models.Index(fields=['country', 'name', 'id'], name='api_univers_country_a25bee_idx'),
+        ),
+    ]
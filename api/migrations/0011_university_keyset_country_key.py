@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_ratelimit'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='university',
+            name='api_univers_country_a25bee_idx',
+        ),
+        migrations.AddIndex(
+            model_name='university',
+            index=models.Index(fields=['country_key', 'name', 'id'], name='api_univers_country_1e9b25_idx'),
+        ),
+    ]
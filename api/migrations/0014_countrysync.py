@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CountrySync',
+            fields=[
+                ('country_key', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('payload_hash', models.CharField(max_length=64)),
+                ('fingerprints', models.JSONField(default=dict)),
+                ('synced_at', models.DateTimeField()),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
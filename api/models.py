@@ -1,15 +1,35 @@
 from django.db import models
 from django.contrib.auth.models import User
+from .countries import normalize_country
+from .geo import geohash_for
 
 class University(models.Model):
     name = models.CharField(max_length=255)
     country = models.CharField(max_length=100)
+    country_key = models.CharField(max_length=100, editable=False)  # normalize_country(country), used for lookups
     lat = models.FloatField(null=True, blank=True)
     lng = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True, editable=False)  # for nearby queries
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = ('name', 'country')  # prevent duplicate entries
+        # prevent duplicate entries; the index also serves country_key lookups
+        unique_together = ('country_key', 'name')
+        indexes = [
+            models.Index(fields=['country_key', 'name', 'id']),  # keyset pagination order
+        ]
+
+    def save(self, *args, **kwargs):
+        self.country_key = normalize_country(self.country)
+        self.geohash = geohash_for(self.lat, self.lng)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            if 'country' in update_fields:
+                update_fields = {*update_fields, 'country_key'}
+            if 'lat' in update_fields or 'lng' in update_fields:
+                update_fields = {*update_fields, 'geohash'}
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} ({self.country})"
@@ -24,3 +44,127 @@ class FavoriteUniversity(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.university.name}"
+
+
+class GeocodeJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    university = models.OneToOneField(University, on_delete=models.CASCADE, related_name='geocode_job')
+    country = models.CharField(max_length=100, db_index=True)  # University.country_key
+    query = models.CharField(max_length=512)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),  # worker claims pending jobs in id order
+        ]
+
+    def __str__(self):
+        return f"{self.query} [{self.status}]"
+
+
+class GeocodeCacheEntry(models.Model):
+    key = models.CharField(max_length=512, unique=True)  # normalized query
+    query = models.CharField(max_length=512)
+    found = models.BooleanField(default=True)  # False records a Nominatim miss
+    lat = models.FloatField(null=True, blank=True)
+    lng = models.FloatField(null=True, blank=True)
+    display_name = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.query} ({'hit' if self.found else 'miss'})"
+
+
+class UniversityCluster(models.Model):
+    # Precomputed map clusters: one row per occupied grid cell per zoom level (see api/clusters.py)
+    country_key = models.CharField(max_length=100)
+    zoom = models.PositiveSmallIntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    count = models.PositiveIntegerField()
+    lat = models.FloatField()  # centroid
+    lng = models.FloatField()
+    university = models.ForeignKey(
+        University, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )  # set when the cell holds a single university
+
+    class Meta:
+        unique_together = ('country_key', 'zoom', 'cell_x', 'cell_y')
+        indexes = [
+            models.Index(fields=['country_key', 'count', 'lat']),  # single-member rows by viewport
+        ]
+
+    def __str__(self):
+        return f"{self.country_key} z{self.zoom} ({self.cell_x}, {self.cell_y}): {self.count}"
+
+
+class RateLimit(models.Model):
+    # Shared state of a rate limiter used by every process (see api/ratelimit.py)
+    name = models.CharField(max_length=50, primary_key=True)
+    next_at = models.FloatField(default=0)  # time.time() before which the next call must wait
+
+    def __str__(self):
+        return self.name
+
+
+class DataVersion(models.Model):
+    # Data version tokens seen by every process (see api/versions.py)
+    key = models.CharField(max_length=150, primary_key=True)
+    version = models.BigIntegerField()  # time.time_ns() of the last change
+
+    def __str__(self):
+        return f"{self.key} @ {self.version}"
+
+
+class Lease(models.Model):
+    # Cross-process lock held by one token until released or expired (see api/singleflight.py)
+    key = models.CharField(max_length=150, primary_key=True)
+    token = models.CharField(max_length=32)
+    expires_at = models.FloatField()  # time.time() after which another process may take it
+
+    def __str__(self):
+        return self.key
+
+
+class CountrySync(models.Model):
+    # What the last incremental sync of a country saw upstream (see api/sync.py)
+    country_key = models.CharField(max_length=100, primary_key=True)
+    payload_hash = models.CharField(max_length=64)  # sha256 of the Hipolabs payload, row order ignored
+    fingerprints = models.JSONField(default=dict)  # university name -> hash of the fields we store
+    synced_at = models.DateTimeField()  # last check, changed or not
+    changed_at = models.DateTimeField()  # last time the payload differed
+
+    def __str__(self):
+        return f"{self.country_key} @ {self.synced_at}"
+
+
+class BackfillCheckpoint(models.Model):
+    # Progress of one backfill_coordinates run over an id range, so it can resume after a kill
+    name = models.CharField(max_length=100, primary_key=True)
+    from_id = models.BigIntegerField(default=0)
+    to_id = models.BigIntegerField(null=True, blank=True)  # exclusive; None for no upper bound
+    last_id = models.BigIntegerField(default=0)  # every row up to here has been tried
+    processed = models.PositiveIntegerField(default=0)
+    located = models.PositiveIntegerField(default=0)
+    not_found = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
@@ -0,0 +1,42 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from .geo import covering_cells, degrees_for_km, haversine_km
+from .models import University
+
+
+def nearby_universities(lat, lng, radius_km, limit):
+    """Universities within `radius_km` of (lat, lng), nearest first.
+
+    Candidates come from a handful of geohash prefix range scans on the indexed
+    `geohash` column; only those rows are loaded and ranked by exact haversine distance.
+    """
+    cells = covering_cells(lat, lng, radius_km)
+    # '~' sorts after every geohash character, so [cell, cell~) is the prefix range
+    in_cells = reduce(or_, (Q(geohash__gte=cell, geohash__lt=cell + '~') for cell in cells))
+    dlat = degrees_for_km(radius_km)
+
+    candidates = University.objects.filter(in_cells, lat__range=(lat - dlat, lat + dlat)).values_list(
+        'id', 'name', 'country', 'lat', 'lng'
+    )
+
+    results = []
+    for uni_id, name, country, ulat, ulng in candidates.iterator(chunk_size=2000):
+        distance = haversine_km(lat, lng, ulat, ulng)
+        if distance <= radius_km:
+            results.append((distance, uni_id, name, country, ulat, ulng))
+
+    results.sort()
+    return [
+        {
+            "id": uni_id,
+            "name": name,
+            "country": country,
+            "lat": ulat,
+            "lng": ulng,
+            "distance_km": round(distance, 3),
+        }
+        for distance, uni_id, name, country, ulat, ulng in results[:limit]
+    ]
@@ -0,0 +1,100 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on (country_key, name, id), backed by the matching composite index.
+
+    Each page is a single index range scan, whatever its depth, and no COUNT(*)
+    is run unless the client asks for it with `?count=true`. Unfiltered lists are
+    always paginated; lists filtered by `?country=` only when `cursor` or `limit`
+    is given, so existing per-country clients keep their plain array.
+    """
+    page_size = 100
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+
+    def is_paginated(self, request):
+        # Per-country lists stay a plain array unless a page is asked for explicitly
+        params = request.query_params
+        return not params.get('country') or self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if not self.is_paginated(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = queryset.count() if params.get(self.count_query_param) in ('1', 'true') else None
+
+        queryset = queryset.order_by('country_key', 'name', 'id')
+        cursor = self.decode_cursor(params.get(self.cursor_query_param))
+        if cursor:
+            country_key, name, pk = cursor
+            # The leading country_key >= bound gives the planner an index range to start from
+            queryset = queryset.filter(
+                Q(country_key__gte=country_key),
+                Q(country_key__gt=country_key)
+                | Q(country_key=country_key, name__gt=name)
+                | Q(country_key=country_key, name=name, id__gt=pk),
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, value):
+        if not value:
+            return None
+        try:
+            country_key, name, pk = json.loads(base64.urlsafe_b64decode(value.encode()))
+            return str(country_key), str(name), int(pk)
+        except (ValueError, TypeError):
+            raise NotFound("Invalid cursor")
+
+    def encode_cursor(self, uni):
+        payload = json.dumps([uni.country_key, uni.name, uni.id], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+        return replace_query_param(url, self.page_size_query_param, self.page_size)
+
+    def get_paginated_response(self, data):
+        payload = {"next": self.get_next_link()}
+        if self.count is not None:
+            payload["count"] = self.count
+        payload["results"] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
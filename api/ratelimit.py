@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import RateLimit
+
+
+class SharedRateLimiter:
+    """At most `rate` calls per second across every process sharing the database.
+
+    Each call reserves the next slot with a single conditional UPDATE on the
+    limiter's RateLimit row, so web workers, the geocode worker and management
+    commands all draw from the same budget. Processes on different hosts rely
+    on their clocks being in sync.
+    """
+
+    def __init__(self, name, rate):
+        self.name = name
+        self.rate = rate
+
+    def _take(self):
+        """Reserve a slot; returns 0 on success, otherwise the seconds to wait before retrying."""
+        now = time.time()
+        if RateLimit.objects.filter(name=self.name, next_at__lte=now).update(next_at=now + 1 / self.rate):
+            return 0
+        next_at = RateLimit.objects.filter(name=self.name).values_list('next_at', flat=True).first()
+        if next_at is None:
+            RateLimit.objects.bulk_create([RateLimit(name=self.name)], ignore_conflicts=True)
+            return 0.001  # row created; retry right away
+        return max(next_at - now, 0.001)
+
+    def acquire(self):
+        if self.rate <= 0:
+            return  # limiting disabled
+        while wait := self._take():
+            time.sleep(wait)
+
+    async def aacquire(self):
+        if self.rate <= 0:
+            return
+        while wait := await sync_to_async(self._take)():
+            await asyncio.sleep(wait)
+
+
+# Shared by every Nominatim call in every process (usage policy: max 1 req/s)
+nominatim_limiter = SharedRateLimiter('nominatim', settings.NOMINATIM_RATE_LIMIT)
@@ -0,0 +1,11 @@
+from rest_framework import renderers
+
+from .metrics import serialization
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """DRF's JSONRenderer, timed as serialization in api/metrics.py."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with serialization():
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections
+import requests
+
+from .countries import normalize_country
+from .geocoding import build_query, cached_geocodes, nominatim_search, store_result
+from .models import University
+from .search import get_index
+
+FIELDS = ('id', 'name', 'country', 'country_key', 'lat', 'lng')
+
+
+def _chunks(items):
+    # One query per lookup, split only where the backend limits parameters (SQLite: 999)
+    size = (connection.features.max_query_params or 100000) - 1
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _located(row):
+    return row["lat"] is not None and row["lng"] is not None
+
+
+def _best(rows, country_key):
+    """The row to answer with among same-named universities: located first, then the oldest."""
+    rows = [row for row in rows if not country_key or row["country_key"] == country_key]
+    return min(rows, key=lambda row: (not _located(row), row["id"]), default=None)
+
+
+def _match(row):
+    return {key: row[key] for key in ('id', 'name', 'country', 'lat', 'lng')}
+
+
+def _search(query):
+    try:
+        return nominatim_search(query), None
+    except requests.RequestException as e:
+        return None, str(e)
+    finally:
+        connections.close_all()  # the rate limiter gives pool threads their own DB connections
+
+
+def resolve_names(items):
+    """Resolve [(name, country or None)] to one result dict per item, in input order.
+
+    Local rows are matched by exact name (one `name__in` query), then by
+    normalize_name() through the in-process search index. Items without a
+    located match are geocoded: cached lookups first, then at most
+    RESOLVE_MAX_GEOCODES Nominatim calls, RESOLVE_GEOCODE_CONCURRENCY at a time.
+    Each result's "source" is "exact", "normalized", "nominatim" or None.
+    """
+    keys = list(dict.fromkeys((name, normalize_country(country) if country else None) for name, country in items))
+    resolved = {}
+    unlocated = {}  # key -> local match that has no coordinates yet
+
+    # 1. Exact names, one query
+    names = list({name for name, _ in keys})
+    by_name = {}
+    for chunk in _chunks(names):
+        for row in University.objects.filter(name__in=chunk).values(*FIELDS):
+            by_name.setdefault(row["name"], []).append(row)
+    for key in keys:
+        row = _best(by_name.get(key[0], ()), key[1])
+        if row and _located(row):
+            resolved[key] = {"source": "exact", "match": _match(row)}
+        elif row:
+            unlocated[key] = ("exact", row)
+
+    # 2. Normalized names (case, accents, punctuation), candidates from the index, rows in one query
+    index = get_index()
+    candidates = {key: index.normalized_ids(key[0], key[1]) for key in keys if key not in resolved}
+    ids = list({uni_id for found in candidates.values() for uni_id in found})
+    rows = {}
+    for chunk in _chunks(ids):
+        rows.update((row["id"], row) for row in University.objects.filter(id__in=chunk).values(*FIELDS))
+    for key, found in candidates.items():
+        row = _best([rows[uni_id] for uni_id in found if uni_id in rows], key[1])
+        if row and _located(row):
+            resolved[key] = {"source": "normalized", "match": _match(row)}
+        elif row:
+            unlocated.setdefault(key, ("normalized", row))
+
+    # 3. Geocode the rest: the cache costs nothing, Nominatim calls are bounded
+    misses = {key: build_query(key[0], "", key[1]) if key[1] else key[0] for key in keys if key not in resolved}
+    cached = {}
+    for chunk in _chunks(list(set(misses.values()))):
+        cached.update(cached_geocodes(chunk))
+    lookups = {}
+    for key, query in misses.items():
+        if query in cached:
+            resolved[key] = _nominatim(cached[query], unlocated.get(key))
+        else:
+            lookups[key] = query
+
+    budget = list(lookups)[:settings.RESOLVE_MAX_GEOCODES]
+    if budget:
+        with ThreadPoolExecutor(max_workers=settings.RESOLVE_GEOCODE_CONCURRENCY) as pool:
+            for key, (result, error) in zip(budget, pool.map(_search, [lookups[key] for key in budget])):
+                if error is not None:
+                    resolved[key] = {"source": None, "match": None, "error": f"Geocoding service unavailable: {error}"}
+                    continue
+                store_result(lookups[key], result)  # the geocode cache, as geocode() would
+                resolved[key] = _nominatim(result, unlocated.get(key))
+    for key in list(lookups)[settings.RESOLVE_MAX_GEOCODES:]:
+        resolved[key] = {"source": None, "match": None, "error": "Geocoding limit reached; retry this item"}
+
+    return [
+        {"name": name, "country": country, **resolved[(name, normalize_country(country) if country else None)]}
+        for name, country in items
+    ]
+
+
+def _nominatim(result, local):
+    """A Nominatim result, attached to the local (source, row) match it locates if there is one."""
+    source, local = local or (None, None)
+    if not result:
+        if local:
+            return {"source": source, "match": _match(local)}  # known, just not located
+        return {"source": None, "match": None, "error": "University not found"}
+    return {"source": "nominatim", "match": {
+        "id": local["id"] if local else None,
+        "name": local["name"] if local else result["display_name"].split(",")[0],
+        "country": local["country"] if local else None,
+        "lat": result["lat"],
+        "lng": result["lng"],
+        "address": result["display_name"],
+    }}
@@ -0,0 +1,166 @@
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+
+from django.conf import settings
+
+from .models import University
+from . import versions
+
+MAX_CANDIDATES = 200
+
+
+def trigrams(text, pad=True):
+    if pad:
+        text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def normalize_name(name):
+    """Casefolded, without accents, punctuation or repeated spaces: "Universidad  de São-Paulo." -> "universidad de sao paulo"."""
+    decomposed = unicodedata.normalize('NFKD', name.casefold())
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[\W_]+', ' ', stripped).split())
+
+
+class NameIndex:
+    """In-process trigram index over University.name.
+
+    Names are indexed casefolded; postings map each trigram to the positions
+    of the names containing it. Only ids, folded names and country keys are
+    kept in memory - coordinates are read from the DB for the final hits so
+    the index does not go stale when the geocoder fills them in.
+    """
+
+    def __init__(self, rows):
+        self.ids = array('q')
+        self.names = []
+        self.countries = []
+        postings = {}
+        for pos, (uni_id, name, country_key) in enumerate(rows):
+            folded = name.casefold()
+            self.ids.append(uni_id)
+            self.names.append(folded)
+            self.countries.append(country_key)
+            for gram in trigrams(folded):
+                postings.setdefault(gram, []).append(pos)
+        self.postings = {gram: array('I', positions) for gram, positions in postings.items()}
+        self._by_key = None  # normalize_name() -> positions, built on first use
+        self._by_key_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, country_key=None, limit=10, min_score=None):
+        """Return [(id, score)] ranked by trigram containment, then Jaccard similarity."""
+        min_score = settings.SEARCH_MIN_SIMILARITY if min_score is None else min_score
+        query_grams = trigrams(query.casefold().strip())
+        known = sorted((g for g in query_grams if g in self.postings), key=lambda g: len(self.postings[g]))
+        if not known:
+            return []
+
+        # Count hits on the rarer trigrams only; very common ones ("uni", "ver") match
+        # nearly every row and are checked exactly on the shortlisted candidates below.
+        common = max(1000, len(self) // 20)
+        rare = [g for g in known if len(self.postings[g]) <= common] or known[:3]
+        counts = Counter()
+        for gram in rare:
+            counts.update(self.postings[gram])
+
+        if country_key:
+            candidates = [pos for pos, _ in counts.most_common() if self.countries[pos] == country_key][:MAX_CANDIDATES]
+        else:
+            candidates = [pos for pos, _ in counts.most_common(MAX_CANDIDATES)]
+
+        scored = []
+        for pos in candidates:
+            name_grams = trigrams(self.names[pos])
+            shared = len(query_grams & name_grams)
+            containment = shared / len(query_grams)
+            if containment >= min_score:
+                scored.append((containment, shared / len(query_grams | name_grams), pos))
+
+        scored.sort(reverse=True)
+        return [(self.ids[pos], round(containment, 3)) for containment, _, pos in scored[:limit]]
+
+    def substring_ids(self, query, country_key=None):
+        """Ids whose name contains `query` (case-insensitive), or None if the query is too short to index."""
+        folded = query.casefold()
+        grams = trigrams(folded, pad=False)
+        if not grams:
+            return None
+        if any(g not in self.postings for g in grams):
+            return []
+
+        rarest = min(grams, key=lambda g: len(self.postings[g]))
+        return [
+            self.ids[pos]
+            for pos in self.postings[rarest]
+            if folded in self.names[pos] and (not country_key or self.countries[pos] == country_key)
+        ]
+
+    def normalized_ids(self, name, country_key=None):
+        """Ids whose normalize_name() equals that of `name`."""
+        if self._by_key is None:
+            with self._by_key_lock:
+                if self._by_key is None:
+                    by_key = {}
+                    for pos, folded in enumerate(self.names):
+                        by_key.setdefault(normalize_name(folded), []).append(pos)
+                    self._by_key = by_key
+        return [
+            self.ids[pos]
+            for pos in self._by_key.get(normalize_name(name), ())
+            if not country_key or self.countries[pos] == country_key
+        ]
+
+
+_index = None
+_index_version = None
+_index_built_at = 0.0
+_lock = threading.Lock()
+
+
+def get_index():
+    """Return this process's NameIndex, rebuilding it when University data changed.
+
+    Rebuilds are throttled to one per SEARCH_INDEX_REFRESH_INTERVAL seconds so a
+    stream of writes (e.g. a load command) cannot turn every search into a rebuild.
+    """
+    global _index, _index_version, _index_built_at
+
+    version = versions.current_version()
+    if _index is not None and (
+        _index_version == version
+        or time.monotonic() - _index_built_at < settings.SEARCH_INDEX_REFRESH_INTERVAL
+    ):
+        return _index
+
+    with _lock:
+        if _index is None or _index_version != version:
+            rows = University.objects.values_list('id', 'name', 'country_key').iterator(chunk_size=5000)
+            _index = NameIndex(rows)
+            _index_version = version
+            _index_built_at = time.monotonic()
+    return _index
+
+
+def search_universities(query, country_key=None, limit=10):
+    """Ranked local matches as dicts with coordinates (one indexed query for the hits)."""
+    hits = get_index().search(query, country_key=country_key, limit=limit)
+    rows = University.objects.in_bulk([uni_id for uni_id, _ in hits])
+    return [
+        {
+            "id": uni_id,
+            "name": rows[uni_id].name,
+            "country": rows[uni_id].country,
+            "lat": rows[uni_id].lat,
+            "lng": rows[uni_id].lng,
+            "score": score,
+        }
+        for uni_id, score in hits
+        if uni_id in rows
+    ]
@@ -1,19 +1,37 @@
 from rest_framework import serializers
-from .models import University
+from .models import FavoriteUniversity, University
 from django.contrib.auth.models import User
 from dj_rest_auth.registration.serializers import RegisterSerializer
 from rest_framework import serializers
 from allauth.account import app_settings as allauth_account_settings
+from .metrics import serialization
 
 class CustomRegisterSerializer(RegisterSerializer):
     email = serializers.EmailField(
         required=allauth_account_settings.SIGNUP_FIELDS['email']['required']
     )
 
+class TimedListSerializer(serializers.ListSerializer):
+    # `many=True` output is timed as serialization in api/metrics.py
+    def to_representation(self, data):
+        with serialization():
+            return super().to_representation(data)
+
+
 class UniversitySerializer(serializers.ModelSerializer):
     class Meta:
         model = University
         fields = ['id', 'name', 'country', 'lat', 'lng']
+        list_serializer_class = TimedListSerializer
+
+
+class FavoriteSerializer(serializers.ModelSerializer):
+    university = UniversitySerializer(read_only=True)
+
+    class Meta:
+        model = FavoriteUniversity
+        fields = ['university', 'added_at']
+        list_serializer_class = TimedListSerializer
 
 
 class UserSerializer(serializers.ModelSerializer):
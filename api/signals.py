@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import University
+from . import versions
+
+
+@receiver(post_save, sender=University)
+@receiver(post_delete, sender=University)
+def university_changed(sender, instance, **kwargs):
+    versions.bump([instance.country_key])
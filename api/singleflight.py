@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+
+from .models import Lease
+
+POLL_INTERVAL = 0.1
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _local_lock(key):
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _try_acquire(key, token, ttl):
+    """Take the lease for `key` if it is free or expired; True if this token now holds it."""
+    now = time.time()
+    # Conditional update, so of two processes taking over an expired lease only one wins
+    if Lease.objects.filter(key=key, expires_at__lte=now).update(token=token, expires_at=now + ttl):
+        return True
+    try:
+        with transaction.atomic():
+            Lease.objects.create(key=key, token=token, expires_at=now + ttl)
+        return True
+    except IntegrityError:
+        return False  # held by another process
+
+
+def _release(key, token):
+    # Don't release a lease that expired and was taken over by another process
+    Lease.objects.filter(key=key, token=token).delete()
+
+
+@contextmanager
+def single_flight(key, wait, ttl):
+    """Hold the lock for `key` in this process and across processes, for at most `ttl` seconds.
+
+    Yields True once the lock is held, or False if it could not be taken within
+    `wait` seconds. Threads of one process queue on a threading.Lock; processes
+    coordinate through a row in the Lease table.
+    """
+    deadline = time.monotonic() + wait
+    local = _local_lock(key)
+    if not local.acquire(timeout=wait):
+        yield False
+        return
+
+    token = uuid.uuid4().hex
+    try:
+        while not _try_acquire(key, token, ttl):
+            if time.monotonic() >= deadline:
+                yield False
+                return
+            time.sleep(POLL_INTERVAL)
+        try:
+            yield True
+        finally:
+            _release(key, token)
+    finally:
+        local.release()
+
+
+@asynccontextmanager
+async def async_single_flight(key, wait, ttl):
+    """single_flight() for async views; shares the cross-process lock, polling without blocking the loop."""
+    deadline = time.monotonic() + wait
+    token = uuid.uuid4().hex
+    while not await sync_to_async(_try_acquire)(key, token, ttl):
+        if time.monotonic() >= deadline:
+            yield False
+            return
+        await asyncio.sleep(POLL_INTERVAL)
+    try:
+        yield True
+    finally:
+        await sync_to_async(_release)(key, token)
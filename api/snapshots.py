@@ -0,0 +1,175 @@
+import gzip
+import os
+import tempfile
+from dataclasses import dataclass
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from .countries import FEATURED_COUNTRIES, normalize_country
+from .fastjson import dumps, location_rows, university_rows
+from .geocoding import with_progress
+from .models import University
+from .serializers import UniversitySerializer
+from . import versions
+
+KINDS = ('list', 'locations')
+SNAPSHOT_COUNTRY_KEYS = frozenset(normalize_country(c) for c in FEATURED_COUNTRIES)
+
+
+@dataclass
+class Snapshot:
+    content: bytes
+    gzipped: bytes
+    count: int = None  # rows rendered; unknown when read back from disk
+
+    @property
+    def empty(self):
+        return self.content == b'[]'
+
+
+def list_payload(country_key, fast=True):
+    """What /api/universities/?country= returns unpaginated, plus the university rows in it."""
+    queryset = University.objects.filter(country_key=country_key)
+    rows = university_rows(queryset) if fast else UniversitySerializer(queryset, many=True).data
+    return with_progress(country_key, rows), rows
+
+
+def locations_payload(country_key, fast=True):
+    """Map markers for a country: up to 50 universities that have coordinates."""
+    universities = University.objects.filter(
+        country_key=country_key,
+        lat__isnull=False,
+        lng__isnull=False
+    )[:50]  # Limit to 50 universities with coordinates
+
+    if fast:
+        rows = location_rows(universities)
+        return rows, rows
+
+    locations = []
+    for uni in universities:
+        # Use stored coordinates (prioritize database over API calls)
+        location_data = {
+            "id": uni.id,
+            "name": uni.name,
+            "country": uni.country,
+            "lat": uni.lat,
+            "lng": uni.lng,
+            "address": f"{uni.name}, {uni.country}",
+            "place_id": ""
+        }
+        locations.append(location_data)
+    return locations, locations
+
+
+PAYLOADS = {'list': list_payload, 'locations': locations_payload}
+
+
+def render(payload, rows, fast=True):
+    return dumps(payload, rows) if fast else JSONRenderer().render(payload)
+
+
+def build_snapshot(kind, country_key):
+    payload, rows = PAYLOADS[kind](country_key)
+    content = render(payload, rows)
+    return Snapshot(content, gzip.compress(content, compresslevel=settings.SNAPSHOT_GZIP_LEVEL, mtime=0), len(rows))
+
+
+def _key(kind, country_key, version):
+    return f'snapshot:{kind}:{country_key}:{version}'
+
+
+def _dir(kind, country_key):
+    return os.path.join(settings.SNAPSHOT_DIR, kind, quote(country_key, safe=''))
+
+
+def _write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _save(kind, country_key, version, snapshot):
+    """Write the snapshot's files and drop those of older versions."""
+    directory = _dir(kind, country_key)
+    os.makedirs(directory, exist_ok=True)
+    # The .json file is written last: it is what _load() looks for
+    _write_atomic(os.path.join(directory, f'{version}.json.gz'), snapshot.gzipped)
+    _write_atomic(os.path.join(directory, f'{version}.json'), snapshot.content)
+    for name in os.listdir(directory):
+        if not name.startswith((f'{version}.', '.tmp-')):
+            try:
+                os.unlink(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass  # removed by another worker
+
+
+def _load(kind, country_key, version):
+    base = os.path.join(_dir(kind, country_key), f'{version}.json')
+    try:
+        with open(base, 'rb') as plain, open(f'{base}.gz', 'rb') as gzipped:
+            return Snapshot(plain.read(), gzipped.read())
+    except FileNotFoundError:
+        return None
+
+
+def get_snapshot(kind, country_key, rebuild=False):
+    """The country's snapshot for its current data version, built on first use.
+
+    Snapshots are keyed by the per-country version, so any write to the country
+    makes the old blob unreachable and the next request renders a fresh one.
+    They are written to SNAPSHOT_DIR, so every worker on the host (and the
+    build_snapshots command) shares one rendering; the cache only keeps a
+    per-process copy in front of the files.
+    """
+    version = versions.current_version(country_key)
+    key = _key(kind, country_key, version)
+    snapshot = None if rebuild else cache.get(key)
+    if snapshot is None:
+        snapshot = None if rebuild else _load(kind, country_key, version)
+        if snapshot is None:
+            snapshot = build_snapshot(kind, country_key)
+            _save(kind, country_key, version, snapshot)
+        cache.set(key, snapshot, settings.SNAPSHOT_CACHE_TIMEOUT)
+    return snapshot
+
+
+def has_snapshot(country):
+    return bool(country) and normalize_country(country) in SNAPSHOT_COUNTRY_KEYS
+
+
+def accepts_gzip(request):
+    """True if Accept-Encoding allows gzip with a non-zero q-value (directly or via `*`)."""
+    qualities = {}
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0.0))) > 0
+
+
+def snapshot_response(request, snapshot):
+    if accepts_gzip(request):
+        response = HttpResponse(snapshot.gzipped, content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(snapshot.content, content_type='application/json')
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
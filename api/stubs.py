@@ -0,0 +1,117 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class StubUpstream:
+    """Local stand-in for Hipolabs (/search) and Nominatim (/nominatim/search).
+
+    Every response waits `latency` seconds (plus up to `jitter` more), and a
+    `failure_rate` share of them are 503s, so benchmarks can exercise the retry,
+    breaker and cold-load paths without touching the real services.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, rows_per_country=50, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rows_per_country = rows_per_country
+        self.hits = {'hipolabs': 0, 'nominatim': 0, 'failed': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def hipolabs_url(self):
+        return f'{self.base_url}/search'
+
+    @property
+    def nominatim_url(self):
+        return f'{self.base_url}/nominatim/search'
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real services
+            disable_nagle_algorithm = True  # headers and body are separate writes
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                status, body = stub.respond(self.path)
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def respond(self, path):
+        parts = urlsplit(path)
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        service = 'nominatim' if parts.path.startswith('/nominatim') else 'hipolabs'
+
+        with self._lock:
+            self.hits[service] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self.hits['failed'] += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return 503, {"error": "stub failure"}
+
+        if service == 'hipolabs':
+            return 200, self.universities(params.get('country', ''))
+        return 200, self.places(params.get('q', ''))
+
+    def universities(self, country):
+        slug = ''.join(c for c in country.lower() if c.isalnum())[:20] or 'x'
+        return [
+            {
+                "name": f"{country} University {i}",
+                "country": country,
+                "state-province": None,
+                "alpha_two_code": "XX",
+                "domains": [f"u{i}.{slug}.edu"],
+                "web_pages": [f"http://u{i}.{slug}.edu"],
+            }
+            for i in range(self.rows_per_country)
+        ]
+
+    def places(self, query):
+        # Deterministic coordinates per query, so repeated runs geocode the same way
+        rng = random.Random(query)
+        return [{
+            "lat": str(round(rng.uniform(-60, 70), 6)),
+            "lon": str(round(rng.uniform(-180, 180), 6)),
+            "display_name": f"{query}, Stubland",
+        }]
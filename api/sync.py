@@ -0,0 +1,135 @@
+import hashlib
+import json
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .countries import normalize_country
+from .geo import geohash_for
+from .models import CountrySync, FavoriteUniversity, University
+from . import versions
+
+
+@dataclass
+class SyncResult:
+    country: str
+    skipped: bool = False  # payload identical to the last sync
+    created: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+
+    @property
+    def changed(self):
+        return bool(self.created or self.updated or self.removed)
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+
+def payload_hash(data):
+    """sha256 of the Hipolabs rows, independent of the order they came in."""
+    digest = hashlib.sha256()
+    for row in sorted(_canonical(row) for row in data):
+        digest.update(row.encode())
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def row_fingerprint(row):
+    # Only what University stores or geocodes from; a new domain alone changes nothing here
+    return hashlib.sha1(_canonical([row.get("country"), row.get("state-province")]).encode()).hexdigest()[:16]
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def sync_country(country, data, locate=None, batch_size=None):
+    """Bring the stored universities of `country` in line with the Hipolabs rows in `data`.
+
+    Countries whose payload hash matches the last sync are skipped. Otherwise
+    new names are inserted, rows whose fingerprint changed are updated and
+    names that are no longer upstream are removed, all in one transaction.
+    `locate(row)` returns (lat, lng) or None and is only called for inserted
+    and updated rows, before the transaction starts.
+    """
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    country_key = normalize_country(country)
+    now = timezone.now()
+    digest = payload_hash(data)
+
+    record = CountrySync.objects.filter(country_key=country_key).first()
+    if record and record.payload_hash == digest:
+        CountrySync.objects.filter(country_key=country_key).update(synced_at=now)
+        return SyncResult(country=country, skipped=True, unchanged=len(record.fingerprints))
+
+    rows = {}
+    for row in data:
+        name = row.get("name")
+        if name:
+            rows[name] = row
+    fingerprints = {name: row_fingerprint(row) for name, row in rows.items()}
+    previous = record.fingerprints if record else {}
+
+    existing = dict(University.objects.filter(country_key=country_key).values_list('name', 'id'))
+    inserted = [name for name in rows if name not in existing]
+    # Without a previous record there is nothing to compare stored rows against
+    updated = [name for name in rows if name in existing and name in previous and previous[name] != fingerprints[name]]
+    # An empty answer is more likely an upstream hiccup than every university closing
+    removed = [uni_id for name, uni_id in existing.items() if name not in rows] if rows else []
+
+    located = {name: locate(rows[name]) for name in inserted + updated} if locate else {}
+    result = SyncResult(country=country, unchanged=len(rows) - len(inserted) - len(updated))
+
+    with transaction.atomic():
+        to_create = []
+        for name in inserted:
+            lat, lng = located.get(name) or (None, None)
+            row_country = rows[name].get("country")
+            to_create.append(University(
+                name=name, country=row_country if normalize_country(row_country) == country_key else country,
+                country_key=country_key, lat=lat, lng=lng, geohash=geohash_for(lat, lng),
+            ))
+        stored = University.objects.filter(country_key=country_key)
+        before = stored.count() if to_create else 0
+        # ignore_conflicts: names another loader inserted since `existing` was read aren't counted
+        University.objects.bulk_create(to_create, batch_size=batch_size, ignore_conflicts=True)
+        result.created = stored.count() - before if to_create else 0
+
+        to_update = [
+            uni for ids in _chunks([existing[name] for name in updated], batch_size)
+            for uni in University.objects.filter(id__in=ids)
+        ]
+        for uni in to_update:
+            row_country = rows[uni.name].get("country")
+            if normalize_country(row_country) == country_key:
+                uni.country = row_country
+            if located.get(uni.name):
+                uni.lat, uni.lng = located[uni.name]
+                uni.geohash = geohash_for(uni.lat, uni.lng)
+        University.objects.bulk_update(to_update, ['country', 'lat', 'lng', 'geohash'], batch_size=batch_size)
+        result.updated = len(to_update)
+
+        users = set()
+        for ids in _chunks(removed, batch_size):
+            # Favorite-ID sets cached for these users would still list the removed rows
+            users.update(FavoriteUniversity.objects.filter(university_id__in=ids).values_list('user_id', flat=True))
+            result.removed += University.objects.filter(id__in=ids).delete()[1].get(University._meta.label, 0)
+        for user_id in users:
+            transaction.on_commit(lambda user_id=user_id: versions.bump_favorites(user_id))
+
+        CountrySync.objects.update_or_create(country_key=country_key, defaults={
+            "payload_hash": digest,
+            "fingerprints": fingerprints,
+            "synced_at": now,
+            "changed_at": now,
+        })
+        if result.changed:
+            transaction.on_commit(lambda: versions.bump([country_key]))
+
+    return result
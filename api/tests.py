@@ -1,3 +1,850 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from contextlib import nullcontext
+from unittest import mock
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+
+from rest_framework.renderers import JSONRenderer
+
+from . import autocomplete
+from .autocomplete import RECENT_LIMIT, PrefixIndex
+from .benchmark import run_suite
+from .clusters import clusters_in_view
+from .favorites import favorite_ids
+from .fastjson import dumps, university_rows
+from .geo import geohash_for, haversine_km
+from .hipolabs import iter_dump
+from .metrics import registry
+from .ingest import ingest_country
+from .models import BackfillCheckpoint, CountrySync, DataVersion, FavoriteUniversity, GeocodeJob, Lease, University, UniversityCluster
+from .nearby import nearby_universities
+from .ratelimit import SharedRateLimiter
+from .search import get_index
+from .serializers import UniversitySerializer
+from .singleflight import _try_acquire, async_single_flight, single_flight
+from .snapshots import accepts_gzip, get_snapshot
+from .stubs import StubUpstream
+from .sync import sync_country
+from .versions import current_version
+
+
+class IngestTests(TestCase):
+    def test_reingest_is_unchanged(self):
+        rows = [{"name": "Alpha University"}, {"name": "Beta University", "lat": 1.0, "lng": 2.0}]
+        first = ingest_country("Peru", rows)
+        second = ingest_country("Peru", rows)
+        self.assertEqual((first.created, first.updated), (2, 0))
+        self.assertEqual((second.created, second.updated, second.unchanged), (0, 0, 2))
+
+    def test_rows_inserted_concurrently_are_not_counted(self):
+        real_geohash_for = geohash_for
+
+        def racing_geohash_for(lat, lng):
+            # Another loader commits one of the same names after the existing rows were read
+            if not University.objects.filter(name="Alpha University").exists():
+                University.objects.create(name="Alpha University", country="Peru")
+            return real_geohash_for(lat, lng)
+
+        with mock.patch('api.ingest.geohash_for', side_effect=racing_geohash_for):
+            result = ingest_country("Peru", [{"name": "Alpha University"}, {"name": "Beta University"}])
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual(University.objects.filter(country_key="peru").count(), 2)
+
+
+class RateLimitTests(TestCase):
+    def test_limiters_with_the_same_name_share_one_budget(self):
+        # Two instances stand in for two processes (web and geocode worker)
+        web, worker = SharedRateLimiter('test', 20), SharedRateLimiter('test', 20)
+        started = time.monotonic()
+        for _ in range(3):
+            web.acquire()
+            worker.acquire()
+        # 6 calls at 20/s: the first is free, the other 5 wait 50ms each
+        self.assertGreaterEqual(time.monotonic() - started, 5 / 20 - 0.01)
+
+
+class IterDumpTests(TestCase):
+    rows = [
+        {"name": "Université \"A\" [1]", "country": "France", "domains": ["a.fr"]},
+        {"name": "B, {not} a brace", "country": "Peru", "state-province": None},
+        {"name": "C", "country": "Japan", "web_pages": [], "nested": {"x": [1, 2.5]}},
+    ]
+
+    def test_every_chunk_boundary(self):
+        text = json.dumps(self.rows, ensure_ascii=False, indent=1)
+        for chunk_size in range(1, len(text) + 1):
+            self.assertEqual(list(iter_dump(io.StringIO(text), chunk_size=chunk_size)), self.rows, chunk_size)
+
+    def test_non_object_rows_are_rejected(self):
+        for chunk_size in (3, 64):
+            with self.assertRaises(ValueError):
+                list(iter_dump(io.StringIO('[{"a":1},  123, 4]'), chunk_size=chunk_size))
+
+    def test_truncated_file(self):
+        text = json.dumps(self.rows)
+        for cut in (len(text) - 1, len(text) // 2, 1):
+            with self.assertRaises(ValueError):
+                list(iter_dump(io.StringIO(text[:cut]), chunk_size=16))
+
+    def test_import_command_reads_gzip(self):
+        fd, path = tempfile.mkstemp(suffix='.json.gz')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with gzip.open(path, 'wt', encoding='utf-8') as fp:
+            json.dump(self.rows, fp)
+
+        call_command('import_universities', path, '--batch-size', '2', stdout=io.StringIO())
+        self.assertEqual(University.objects.count(), 3)
+
+        with open(path, 'wb') as fp:
+            fp.write(gzip.compress(json.dumps(self.rows).encode()[:-10]))
+        with self.assertRaises(CommandError):
+            call_command('import_universities', path, stdout=io.StringIO())
+
+
+class NearbyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(8)
+        points = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(600)]
+        # Dense patches near a pole, the antimeridian and the equator
+        for clat, clng in ((88.5, 10.0), (-87.0, -120.0), (5.0, 179.9), (0.0, 0.0)):
+            points += [(max(-90.0, min(90.0, clat + rng.uniform(-3, 3))), (clng + rng.uniform(-8, 8) + 180) % 360 - 180)
+                       for _ in range(150)]
+        University.objects.bulk_create([
+            University(name=f"U{i}", country="Testland", country_key="testland",
+                       lat=lat, lng=lng, geohash=geohash_for(lat, lng))
+            for i, (lat, lng) in enumerate(points)
+        ])
+        cls.points = list(University.objects.values_list('id', 'lat', 'lng'))
+
+    def test_matches_brute_force(self):
+        for lat, lng, radius in (
+            (88.5, 10.0, 150), (89.9, 0.0, 20), (-87.0, -120.0, 300), (5.0, 179.9, 400),
+            (5.0, -179.95, 50), (0.0, 0.0, 1), (0.0, 0.0, 250), (60.0, 30.0, 3000), (45.0, 45.0, 15000),
+        ):
+            expected = sorted(
+                uid for uid, ulat, ulng in self.points if haversine_km(lat, lng, ulat, ulng) <= radius
+            )
+            found = nearby_universities(lat, lng, radius, limit=10 ** 6)
+            self.assertEqual(sorted(r["id"] for r in found), expected, (lat, lng, radius))
+
+
+class ClusterTests(TestCase):
+    def test_reads_do_not_build_and_the_worker_builds_once_drained(self):
+        located = [University.objects.create(name=f"U{i}", country="Peru", lat=-12.0 - i / 100, lng=-77.0) for i in range(3)]
+        pending = University.objects.create(name="Pending", country="Peru")
+        GeocodeJob.objects.create(university=pending, country="peru", query="Pending, Peru")
+
+        view = clusters_in_view("peru", 3, (-20.0, -80.0, 0.0, -70.0))
+        self.assertEqual((view["clusters"], view["points"]), ([], []))
+        self.assertFalse(UniversityCluster.objects.exists())
+
+        with mock.patch('api.management.commands.geocode_worker.geocode', return_value={"lat": -12.5, "lng": -77.0}):
+            call_command('geocode_worker', '--once', stdout=io.StringIO())
+
+        view = clusters_in_view("peru", 3, (-20.0, -80.0, 0.0, -70.0))
+        self.assertEqual(sum(c["count"] for c in view["clusters"]), len(located) + 1)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Same names in several countries, and one country spelled two ways
+        for country in ("Peru", "PERU", "Chile", "Japan"):
+            for i in range(5):
+                University.objects.create(name=f"{country[0]}{i} University" if country == "PERU" else f"U{i}", country=country)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url, HTTP_HOST='localhost')
+            self.assertEqual(response.status_code, 200)
+            ids += [row["id"] for row in response.json()["results"]]
+            url = response.json()["next"]
+        return ids
+
+    def test_walk_yields_every_row_once_in_index_order(self):
+        expected = list(University.objects.order_by('country_key', 'name', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/api/universities/?limit=3'), expected)
+        self.assertEqual(
+            self.walk('/api/universities/?country=peru&limit=2'),
+            list(University.objects.filter(country_key='peru').order_by('name', 'id').values_list('id', flat=True)),
+        )
+
+    def test_count_and_invalid_cursor(self):
+        response = self.client.get('/api/universities/?limit=2&count=true', HTTP_HOST='localhost')
+        self.assertEqual(response.json()["count"], University.objects.count())
+        self.assertNotIn("count", self.client.get('/api/universities/?limit=2', HTTP_HOST='localhost').json())
+        self.assertEqual(self.client.get('/api/universities/?cursor=not-a-cursor', HTTP_HOST='localhost').status_code, 404)
+
+    def test_pages_are_index_range_scans(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite query plan')
+        qs = University.objects.filter(country_key__gte='japan').order_by('country_key', 'name', 'id')[:10]
+        self.assertNotIn('TEMP B-TREE', qs.explain())
+
+
+class VersionTests(TestCase):
+    def test_bump_from_another_process_invalidates_etags(self):
+        University.objects.create(name="U1", country="Chile")
+        first = self.client.get('/api/universities/?country=chile', HTTP_HOST='localhost')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.get(
+            '/api/universities/?country=chile', HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=first['ETag']
+        ).status_code, 304)
+
+        # The geocode worker only shares the database with this process
+        University.objects.filter(name="U1").update(lat=1.0, lng=2.0)
+        DataVersion.objects.filter(key__in=['universities:version', 'universities:version:chile']).update(
+            version=current_version('chile') + 1
+        )
+
+        second = self.client.get(
+            '/api/universities/?country=chile', HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=first['ETag']
+        )
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()[0]["lat"], 1.0)
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.settings = override_settings(SNAPSHOT_DIR=self.directory)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+
+    def test_snapshots_are_shared_through_files(self):
+        University.objects.create(name="U1", country="Peru")
+        built = get_snapshot('list', 'peru')
+        cache.clear()  # another worker: nothing in its local cache
+
+        with mock.patch('api.snapshots.build_snapshot') as build:
+            loaded = get_snapshot('list', 'peru')
+        build.assert_not_called()
+        self.assertEqual((loaded.content, loaded.gzipped), (built.content, built.gzipped))
+        self.assertEqual(gzip.decompress(loaded.gzipped), loaded.content)
+
+        University.objects.create(name="U2", country="Peru")
+        self.assertIn(b'U2', get_snapshot('list', 'peru').content)
+        self.assertEqual(len(os.listdir(os.path.join(self.directory, 'list', 'peru'))), 2)  # old version removed
+
+    def test_accepts_gzip_honours_q_values(self):
+        cases = {
+            'gzip': True, 'deflate, gzip;q=0.5': True, 'br, *': True, 'GZIP; Q=1': True,
+            '': False, 'gzip;q=0': False, 'gzip;q=0.0, br': False, '*;q=0': False, 'identity': False,
+            'gzip;q=0, *': False,
+        }
+        for header, expected in cases.items():
+            request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(accepts_gzip(request), expected, header)
+
+
+class FastJsonTests(TestCase):
+    def test_matches_the_drf_renderer(self):
+        for name, lat, lng in (
+            ("Line\u2028Para\u2029Sep", 1e-05, 1e16), ("Ünïcödé \"q\" \\ </script>", -0.0001, 123456789.123),
+            ("Plain", None, None), ("Tiny", 5e-324, -1.7976931348623157e308), ("Round", 10.0, -77.5),
+        ):
+            University.objects.create(name=name, country="Peru", lat=lat, lng=lng)
+        queryset = University.objects.order_by('id')
+        expected = JSONRenderer().render(UniversitySerializer(queryset, many=True).data)
+
+        # With orjson when it is installed, and with the stdlib fallback
+        for encoder in (nullcontext(), mock.patch('api.fastjson.orjson', None)):
+            with encoder:
+                rows = university_rows(queryset)
+                self.assertEqual(dumps(rows, rows), expected)
+                envelope = {"results": rows, "geocoding": {"pending": 1}}
+                self.assertEqual(dumps(envelope, rows), JSONRenderer().render(envelope))
+
+    def test_nan_is_rejected_like_drf(self):
+        rows = [{"id": 1, "name": "N", "country": "Peru", "lat": float('nan'), "lng": 1.0}]
+        with self.assertRaises(ValueError):
+            JSONRenderer().render(rows)
+        with self.assertRaises(ValueError):
+            dumps(rows, rows)
+
+
+class SingleFlightTests(TestCase):
+    def test_lease_held_by_another_process(self):
+        self.assertTrue(_try_acquire('country:peru', 'other-process', 60))
+        with single_flight('country:peru', 0.2, 60) as acquired:
+            self.assertFalse(acquired)
+
+        async def take():
+            async with async_single_flight('country:peru', 0.2, 60) as acquired:
+                return acquired
+        self.assertFalse(async_to_sync(take)())
+
+    def test_expired_lease_is_taken_over_and_released(self):
+        self.assertTrue(_try_acquire('country:peru', 'crashed-process', -1))
+        with single_flight('country:peru', 0.2, 60) as acquired:
+            self.assertTrue(acquired)
+            self.assertNotEqual(Lease.objects.get(key='country:peru').token, 'crashed-process')
+        self.assertFalse(Lease.objects.filter(key='country:peru').exists())
+
+    def test_release_keeps_a_lease_taken_over_by_someone_else(self):
+        with single_flight('country:peru', 0, 60) as acquired:
+            self.assertTrue(acquired)
+            Lease.objects.filter(key='country:peru').update(token='next-holder')
+        self.assertEqual(Lease.objects.get(key='country:peru').token, 'next-holder')
+
+
+class AsyncListTests(TestCase):
+    def test_failed_fetch_is_not_retried_by_the_sync_view(self):
+        client = AsyncClient(HTTP_HOST='localhost')
+        with mock.patch('api.views_async.afetch_country', side_effect=requests.ConnectionError) as afetch, \
+                mock.patch('api.views.fetch_country') as fetch:
+            response = async_to_sync(client.get)('/api/async/universities/?country=Atlantis')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        self.assertEqual(afetch.call_count, 1)
+        fetch.assert_not_called()
+
+    def test_empty_upstream_result_is_fetched_once(self):
+        client = AsyncClient(HTTP_HOST='localhost')
+        with mock.patch('api.views_async.afetch_country', return_value=[]) as afetch, \
+                mock.patch('api.views.fetch_country') as fetch:
+            response = async_to_sync(client.get)('/api/async/universities/?country=Atlantis')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(afetch.call_count, 1)
+        fetch.assert_not_called()
+
+
+class FavoriteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ana', password='pw')
+        cls.unis = [University.objects.create(name=f"U{i}", country="Philippines") for i in range(4)]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def api(self, method, ids):
+        return getattr(self.client, method)(
+            '/api/favorites/', data=json.dumps({"university_ids": ids}),
+            content_type='application/json', HTTP_HOST='localhost',
+        )
+
+    def test_bulk_add_list_and_remove(self):
+        ids = [u.id for u in self.unis]
+        response = self.api('post', ids[:3] + [ids[0], 999999])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"added": 3, "not_found": [999999]})
+        self.assertEqual(self.api('post', ids[:2]).json()["added"], 0)
+
+        with self.assertNumQueries(3):  # session, user, favorites joined with universities
+            listed = self.client.get('/api/favorites/', HTTP_HOST='localhost').json()
+        self.assertEqual({f["university"]["id"] for f in listed}, set(ids[:3]))
+
+        self.assertEqual(self.api('delete', ids[1:]).json(), {"removed": 2})
+        self.assertEqual(list(FavoriteUniversity.objects.values_list('university_id', flat=True)), [ids[0]])
+
+    def test_invalid_and_anonymous_requests(self):
+        for body in ([], ["1"], [True], list(range(1001))):
+            self.assertEqual(self.api('post', body).status_code, 400, body)
+        self.client.logout()
+        self.assertIn(self.api('post', [self.unis[0].id]).status_code, (401, 403))
+
+    def test_cached_set_follows_changes(self):
+        request = RequestFactory().get('/universities/')
+        request.user = self.user
+        self.assertEqual(favorite_ids(request), frozenset())
+
+        self.api('post', [self.unis[0].id])
+        request = RequestFactory().get('/universities/')
+        request.user = self.user
+        self.assertEqual(favorite_ids(request), {self.unis[0].id})
+        with self.assertNumQueries(0):
+            favorite_ids(request)
+
+    def test_page_marks_favorites_and_revalidates_after_a_change(self):
+        first = self.client.get('/universities/', HTTP_HOST='localhost')
+        self.assertEqual(first.status_code, 200)
+        self.assertNotContains(first, 'data-favorite="true"')
+
+        self.api('post', [self.unis[1].id])
+        second = self.client.get('/universities/', HTTP_HOST='localhost', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertContains(second, f'data-favorite="true" onclick="toggleFavorite(this, {self.unis[1].id})"')
+
+
+@override_settings(UNIVERSITIES_PAGE_SIZE=2, GOOGLE_MAP_ID='map-123')
+class UniversitiesPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ana', password='pw')
+        for name in ("Delta", "Alpha", "Echo", "Charlie", "Bravo"):
+            University.objects.create(name=name, country="Japan")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get(self, query):
+        return self.client.get(f'/universities/?country=Japan{query}', HTTP_HOST='localhost')
+
+    def card_names(self, html):
+        return [line.split('>')[1].split('<')[0] for line in html.splitlines() if 'class="university-name"' in line]
+
+    def test_pages_and_fragments(self):
+        first = self.get('')
+        self.assertEqual(self.card_names(first.content.decode()), ["Alpha", "Bravo"])
+        self.assertContains(first, 'data-next="/universities/?country=Japan&amp;page=2&amp;partial=1"')
+        self.assertContains(first, "mapId = 'map-123'")
+
+        fragment = self.get('&page=2&partial=1').content.decode()
+        self.assertNotIn('<html', fragment)
+        self.assertEqual(self.card_names(fragment), ["Charlie", "Delta"])
+
+        last = self.get('&page=3&partial=1').content.decode()
+        self.assertEqual(self.card_names(last), ["Echo"])
+        self.assertNotIn('class="load-more"', last)
+
+    def test_stream_sends_every_card_in_chunks(self):
+        response = self.get('&stream=1')
+        self.assertTrue(response.streaming)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 5)  # head, three batches of cards, tail
+        html = ''.join(chunks)
+        self.assertEqual(self.card_names(html), ["Alpha", "Bravo", "Charlie", "Delta", "Echo"])
+        self.assertNotIn('class="load-more"', html)
+        self.assertIn('</html>', chunks[-1])
+
+    def test_stream_of_an_empty_country(self):
+        response = self.client.get('/universities/?country=Atlantis&stream=1', HTTP_HOST='localhost')
+        self.assertContains(response, 'No universities found')
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        University.objects.create(name='Uni "One", Main', country="Peru", lat=-12.05, lng=-77.04)
+        University.objects.create(name="Ünï Two", country="Peru")
+        University.objects.create(name="Three", country="Chile", lat=-33.4, lng=-70.6)
+
+    def export(self, query):
+        response = self.client.get(f'/api/universities/export/?{query}', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        _, body = self.export('country=peru')
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([r["name"] for r in rows], ['Uni "One", Main', "Ünï Two"])
+        self.assertEqual(rows[1]["lat"], None)
+
+    def test_geojson(self):
+        response, body = self.export('format=geojson')
+        self.assertEqual(response['Content-Type'], 'application/geo+json')
+        collection = json.loads(body)
+        self.assertEqual(collection["type"], "FeatureCollection")
+        self.assertEqual([f["geometry"] and f["geometry"]["coordinates"] for f in collection["features"]],
+                         [[-77.04, -12.05], None, [-70.6, -33.4]])
+
+    def test_csv_with_coordinate_filters(self):
+        _, body = self.export('format=csv&has_coordinates=true')
+        rows = list(csv.reader(io.StringIO(body.decode())))
+        self.assertEqual(rows[0], ['id', 'name', 'country', 'lat', 'lng'])
+        self.assertEqual([r[1] for r in rows[1:]], ['Uni "One", Main', "Three"])
+
+        _, body = self.export('format=csv&has_coordinates=false')
+        self.assertEqual([r[1] for r in list(csv.reader(io.StringIO(body.decode())))[1:]], ["Ünï Two"])
+
+    @override_settings(EXPORT_BLOCK_BYTES=64)
+    def test_gzip_stream_in_blocks(self):
+        _, plain = self.export('format=ndjson')
+        response, body = self.export('format=ndjson&compress=gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), plain)
+
+        chunks = list(self.client.get('/api/universities/export/', HTTP_HOST='localhost').streaming_content)
+        self.assertGreater(len(chunks), 1)
+
+    def test_bad_parameters(self):
+        for query in ('format=xml', 'has_coordinates=maybe'):
+            self.assertEqual(self.client.get(f'/api/universities/export/?{query}', HTTP_HOST='localhost').status_code, 400)
+
+
+class BenchmarkTests(TestCase):
+    def test_stub_latency_and_failures(self):
+        with StubUpstream(latency=0.05, failure_rate=1.0) as stub:
+            started = time.monotonic()
+            response = requests.get(stub.hipolabs_url, params={"country": "Peru"}, timeout=5)
+            self.assertGreaterEqual(time.monotonic() - started, 0.05)
+            self.assertEqual(response.status_code, 503)
+        with StubUpstream(rows_per_country=3) as stub:
+            rows = requests.get(stub.hipolabs_url, params={"country": "Peru"}, timeout=5).json()
+            self.assertEqual([r["country"] for r in rows], ["Peru"] * 3)
+            self.assertIn("lat", requests.get(stub.nominatim_url, params={"q": "X"}, timeout=5).json()[0])
+
+    def test_suite_covers_every_api_route(self):
+        from .urls import urlpatterns
+
+        snapshot_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, snapshot_dir)
+        with StubUpstream(rows_per_country=2) as stub:
+            results = run_suite([120], 1, stub, snapshot_dir)
+        rows = results["120"]
+        self.assertEqual(sum(r["errors"] for r in rows), 0)
+        self.assertTrue(all(r["p99_ms"] >= r["p50_ms"] >= 0 and r["queries_max"] >= r["queries_p50"] for r in rows))
+
+        names = ' '.join(r["name"] for r in rows)
+        for pattern in urlpatterns:
+            self.assertIn(f'/api/{pattern.pattern}', names)
+        for command in ('load_universities', 'fetch_universities', 'import_universities', 'GET /universities/'):
+            self.assertIn(command, names)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('ops', password='pw', is_staff=True)
+        University.objects.create(name="Pontifical University", country="Peru", lat=-12.0, lng=-77.0)
+
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+
+    def test_staff_only_prometheus_endpoint(self):
+        self.client.get('/api/universities/?country=peru', HTTP_HOST='localhost')
+        self.assertIn(self.client.get('/api/metrics/', HTTP_HOST='localhost').status_code, (401, 403))
+
+        self.client.force_login(self.staff)
+        response = self.client.get('/api/metrics/', HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="/api/universities/",le="+Inf"} 1', text)
+        self.assertIn('http_requests_total{method="GET",route="/api/universities/",status="200"} 1', text)
+
+        self.assertGreater(registry.get('http_request_db_queries', route='/api/universities/').sum, 0)
+        self.assertGreater(registry.get('http_request_serialization_seconds', route='/api/universities/').sum, 0)
+
+    def test_upstream_time_per_host(self):
+        with StubUpstream(latency=0.02, rows_per_country=2) as stub, override_settings(HIPOLABS_URL=stub.hipolabs_url):
+            self.client.get('/api/universities/?country=Stubland', HTTP_HOST='localhost')
+            upstream = registry.get('http_request_upstream_seconds', route='/api/universities/', host=stub.base_url)
+        self.assertEqual(upstream.count, 1)
+        self.assertGreaterEqual(upstream.sum, 0.02)
+
+    def test_queries_of_async_views_and_streamed_bodies_are_counted(self):
+        async_to_sync(AsyncClient().get)('/api/async/universities/?country=peru', HTTP_HOST='localhost')
+        self.assertGreater(registry.get('http_request_db_queries', route='/api/async/universities/').sum, 0)
+
+        response = self.client.get('/api/universities/export/', HTTP_HOST='localhost')
+        self.assertIsNone(registry.get('http_request_db_queries', route='/api/universities/export/'))
+        b''.join(response.streaming_content)
+        self.assertGreater(registry.get('http_request_db_queries', route='/api/universities/export/').sum, 0)
+
+    def test_slow_request_breakdown_is_logged(self):
+        with override_settings(SLOW_REQUEST_MS=0.001), self.assertLogs('api.metrics', 'WARNING') as logs:
+            self.client.get('/api/universities/?country=peru', HTTP_HOST='localhost')
+        self.assertIn('GET /api/universities/ -> 200', logs.output[0])
+        self.assertIn('queries', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+class SyncTests(TestCase):
+    rows = [
+        {"name": "Alpha University", "country": "Peru", "state-province": None, "domains": ["a.pe"]},
+        {"name": "Beta University", "country": "Peru", "state-province": "Lima", "domains": ["b.pe"]},
+        {"name": "Gamma University", "country": "Peru", "state-province": None, "domains": ["c.pe"]},
+    ]
+
+    def test_unchanged_payload_is_skipped(self):
+        located = []
+
+        def locate(row):
+            located.append(row["name"])
+            return 1.0, 2.0
+
+        first = sync_country("Peru", self.rows, locate=locate)
+        self.assertEqual((first.created, first.updated, first.removed), (3, 0, 0))
+        self.assertEqual(University.objects.filter(country_key="peru", lat=1.0).count(), 3)
+
+        version = current_version("peru")
+        with self.assertNumQueries(2):  # read the record, touch synced_at
+            second = sync_country("Peru", list(reversed(self.rows)), locate=locate)
+        self.assertTrue(second.skipped)
+        self.assertEqual(len(located), 3)
+        self.assertEqual(current_version("peru"), version)
+
+    def test_only_changed_rows_are_applied(self):
+        user = User.objects.create_user('ana', password='pw')
+        sync_country("Peru", self.rows)
+        gamma = University.objects.get(name="Gamma University")
+        FavoriteUniversity.objects.create(user=user, university=gamma)
+
+        changed = [
+            {**self.rows[0], "domains": ["new.pe"]},  # not something University stores
+            {**self.rows[1], "state-province": "Cusco"},
+            {"name": "Delta University", "country": "Peru"},
+        ]
+        located = []
+        result = sync_country("Peru", changed, locate=lambda row: located.append(row["name"]) or (5.0, 6.0))
+
+        self.assertEqual((result.created, result.updated, result.removed, result.unchanged), (1, 1, 1, 1))
+        self.assertEqual(sorted(located), ["Beta University", "Delta University"])
+        self.assertEqual(
+            sorted(University.objects.filter(country_key="peru").values_list('name', 'lat')),
+            [("Alpha University", None), ("Beta University", 5.0), ("Delta University", 5.0)],
+        )
+        self.assertFalse(FavoriteUniversity.objects.exists())
+        self.assertEqual(CountrySync.objects.get(country_key="peru").fingerprints.keys(),
+                         {"Alpha University", "Beta University", "Delta University"})
+
+    def test_empty_payload_removes_nothing(self):
+        sync_country("Peru", self.rows)
+        result = sync_country("Peru", [])
+        self.assertEqual(result.removed, 0)
+        self.assertEqual(University.objects.filter(country_key="peru").count(), 3)
+
+    def test_incremental_load_command(self):
+        out = io.StringIO()
+        with StubUpstream(rows_per_country=4) as stub, override_settings(HIPOLABS_URL=stub.hipolabs_url), \
+                mock.patch('api.management.commands.load_universities.geocode', return_value=None):
+            call_command('load_universities', '--countries', 'Peru', '--incremental', stdout=out)
+            University.objects.filter(name="Peru University 0").delete()
+            University.objects.create(name="Gone University", country="Peru")
+            call_command('load_universities', '--stored', '--incremental', stdout=out)
+            stub.rows_per_country = 3
+            call_command('load_universities', '--stored', '--incremental', stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('Synced Peru: 4 added, 0 updated, 0 removed', output)
+        self.assertIn('Skipped Peru: unchanged since the last sync', output)
+        self.assertIn('Synced Peru: 1 added, 0 updated, 2 removed, 2 unchanged', output)
+        self.assertEqual(
+            sorted(University.objects.filter(country_key="peru").values_list('name', flat=True)),
+            [f"Peru University {i}" for i in range(3)],
+        )
+
+
+class BackfillTests(TestCase):
+    def setUp(self):
+        self.unis = [
+            University.objects.create(name=f"U{i}", country="Peru", lat=(1.0 if i == 2 else None), lng=(1.0 if i == 2 else None))
+            for i in range(6)
+        ]
+
+    def backfill(self, *args, geocode=None):
+        out = io.StringIO()
+        with mock.patch('api.management.commands.backfill_coordinates.geocode',
+                        side_effect=geocode or (lambda query: {"lat": 5.0, "lng": 6.0, "display_name": query})):
+            call_command('backfill_coordinates', '--batch-size', '2', *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_resumes_from_the_checkpoint_after_a_kill(self):
+        queried = []
+
+        def dies_on_the_fourth_call(query):
+            queried.append(' '.join(query.split()))
+            if len(queried) == 4:
+                raise KeyboardInterrupt  # killed in the middle of the second batch
+            return {"lat": 5.0, "lng": 6.0, "display_name": query}
+
+        with self.assertRaises(KeyboardInterrupt):
+            self.backfill(geocode=dies_on_the_fourth_call)
+        checkpoint = BackfillCheckpoint.objects.get(name='range-0-end')
+        self.assertEqual((checkpoint.last_id, checkpoint.located), (self.unis[1].id, 2))
+
+        queried.clear()
+        output = self.backfill(geocode=lambda query: queried.append(' '.join(query.split())) or None)
+        self.assertEqual(queried, ["U3 Peru", "U4 Peru", "U5 Peru"])  # U2 already has coordinates
+        self.assertIn('2 located, 3 not found, 0 failed', output)
+        self.assertEqual(University.objects.filter(lat=5.0).count(), 2)
+        self.assertIn('already finished', self.backfill())
+
+    def test_shards_split_the_id_range(self):
+        job = GeocodeJob.objects.create(university=self.unis[0], country="peru", query="U0 Lima Peru",
+                                        status=GeocodeJob.STATUS_FAILED)
+        queried = []
+
+        def geocode(query):
+            queried.append(' '.join(query.split()))
+            return {"lat": 5.0, "lng": 6.0, "display_name": query}
+
+        self.backfill('--shard', '1', '--shards', '2', geocode=geocode)
+        first = BackfillCheckpoint.objects.get(name='shard-1-of-2')
+        self.assertEqual((first.from_id, first.to_id), (self.unis[0].id, self.unis[3].id))
+        self.assertEqual(queried, ["U0 Lima Peru", "U1 Peru"])
+        job.refresh_from_db()
+        self.assertEqual(job.status, GeocodeJob.STATUS_DONE)
+
+        queried.clear()
+        self.backfill('--shard', '2', '--shards', '2', geocode=geocode)
+        self.assertEqual(queried, ["U3 Peru", "U4 Peru", "U5 Peru"])
+        self.assertIsNone(BackfillCheckpoint.objects.get(name='shard-2-of-2').to_id)
+
+    def test_pending_jobs_are_left_to_the_worker_and_upstream_errors_counted(self):
+        GeocodeJob.objects.create(university=self.unis[0], country="peru", query="U0 Peru")
+
+        def flaky(query):
+            if query.split() == ["U1", "Peru"]:
+                raise requests.ConnectionError("down")
+            return {"lat": 5.0, "lng": 6.0, "display_name": query}
+
+        self.assertIn('3 located, 0 not found, 1 failed', self.backfill(geocode=flaky))
+        self.assertIsNone(University.objects.get(name="U0").lat)
+
+
+class BatchSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.sao = University.objects.create(name="Universidade de São Paulo", country="Brazil", lat=-23.5, lng=-46.7)
+        cls.lima = University.objects.create(name="Universidad de Lima", country="Peru", lat=-12.1, lng=-77.0)
+        cls.chile = University.objects.create(name="Universidad de Lima", country="Chile")
+        cls.unlocated = University.objects.create(name="Hidden College", country="Peru")
+
+    def resolve(self, items):
+        return self.client.post('/api/search-university/batch/', data=json.dumps({"items": items}),
+                                content_type='application/json', HTTP_HOST='localhost')
+
+    def test_exact_normalized_and_geocoded_in_input_order(self):
+        looked_up = []
+
+        def nominatim(query):
+            looked_up.append(query)
+            return {"lat": 1.0, "lng": 2.0, "display_name": f"{query}, Somewhere"} if "Hidden" in query else None
+
+        get_index()
+        # Exact names, the index's version check, normalized rows and the geocode cache, however
+        # many items; then storing each of the 2 Nominatim answers (update_or_create: 6 queries)
+        with mock.patch('api.resolve.nominatim_search', side_effect=nominatim), self.assertNumQueries(4 + 2 * 6):
+            response = self.resolve([
+                "UNIVERSIDADE DE SAO PAULO.",
+                {"name": "Universidad de Lima", "country": "peru"},
+                {"name": "Hidden College", "country": "Peru"},
+                "Nowhere Institute",
+                "UNIVERSIDADE DE SAO PAULO.",
+            ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([r["source"] for r in results], ["normalized", "exact", "nominatim", None, "normalized"])
+        self.assertEqual(results[0]["match"]["id"], self.sao.id)
+        self.assertEqual(results[1]["match"]["id"], self.lima.id)
+        self.assertEqual((results[2]["match"]["id"], results[2]["match"]["lat"]), (self.unlocated.id, 1.0))
+        self.assertEqual(results[3]["error"], "University not found")
+        self.assertEqual(len(looked_up), 2)  # the repeated name is resolved once
+
+    @override_settings(RESOLVE_MAX_GEOCODES=1)
+    def test_geocoding_is_bounded(self):
+        with mock.patch('api.resolve.nominatim_search', return_value=None) as nominatim:
+            results = self.resolve(["Nowhere A", "Nowhere B", "Nowhere C"]).json()["results"]
+        self.assertEqual(nominatim.call_count, 1)
+        self.assertEqual([r["error"] for r in results][1:], ["Geocoding limit reached; retry this item"] * 2)
+
+    def test_bad_requests(self):
+        for items in ([], "Lima", [{"country": "Peru"}], [""], [{"name": "Lima", "country": 3}]):
+            self.assertEqual(self.resolve(items).status_code, 400)
+        with override_settings(RESOLVE_MAX_ITEMS=2):
+            self.assertEqual(self.resolve(["a", "b", "c"]).status_code, 400)
+
+
+@override_settings(AUTOCOMPLETE_REFRESH_INTERVAL=0)
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lima = University.objects.create(name="Universidad de Lima", country="Peru")
+        cls.limerick = University.objects.create(name="University of Limerick", country="Ireland")
+        cls.sao = University.objects.create(name="Universidade de São Paulo", country="Brazil")
+
+    def setUp(self):
+        autocomplete._index = None  # ids are reused once a test's rows are rolled back
+
+    def complete(self, **params):
+        return self.client.get('/api/universities/autocomplete/', params, HTTP_HOST='localhost')
+
+    def names(self, **params):
+        return [result["name"] for result in self.complete(**params).json()["results"]]
+
+    def test_prefix_of_any_word(self):
+        self.assertEqual(self.names(q="lim"), ["Universidad de Lima", "University of Limerick"])
+        self.assertEqual(self.names(q="sao pau"), ["Universidade de São Paulo"])
+        self.assertEqual(self.names(q="lim", country="ireland"), ["University of Limerick"])
+        self.assertEqual(self.names(q="lim", country="Atlantis"), [])
+        self.assertEqual(self.names(q="unive", limit=1), ["Universidad de Lima"])  # whole name first, then shortest
+        self.assertEqual(self.complete(q="lim").json()["results"][0],
+                         {"id": self.lima.id, "name": "Universidad de Lima", "country": "Peru"})
+
+    def test_bad_requests(self):
+        self.assertEqual(self.complete().status_code, 400)
+        self.assertEqual(self.complete(q="lim", limit="x").status_code, 400)
+        self.assertEqual(self.complete(q="lim", limit=0).status_code, 400)
+
+    def test_refreshed_incrementally(self):
+        index = autocomplete.get_index()
+        added = University.objects.create(name="Lima Institute of Technology", country="Peru")
+        self.assertEqual(self.names(q="lima inst"), ["Lima Institute of Technology"])
+        self.limerick.delete()
+        self.assertEqual(self.names(q="lim"), ["Lima Institute of Technology", "Universidad de Lima"])
+        self.assertIs(autocomplete.get_index(), index)
+        self.assertEqual(index.stats()["rows"], 3)
+        added.delete()
+        # Version, new rows, per-country counts, and the ids of the only country whose count changed
+        with self.assertNumQueries(4):
+            self.assertEqual(len(self.names(q="lim")), 1)
+
+    def test_inserts_kept_apart_then_merged(self):
+        index = PrefixIndex(2 ** 24)
+        index.add_rows([(1, "Zeta College", "Peru", "peru")])
+        index.add_rows([(2, "Alpha College of Lima", "Peru", "peru")])
+        self.assertEqual((len(index.entries), len(index.recent)), (2, 4))
+        self.assertEqual([r["id"] for r in index.complete("college", "peru")], [1, 2])  # shorter first
+        index.remove_missing("peru", {1})
+        self.assertEqual([r["id"] for r in index.complete("col")], [1])
+
+        index.add_rows([(i, f"College {i:05d} of Lima", "Peru", "peru") for i in range(3, RECENT_LIMIT // 3)])
+        self.assertEqual(len(index.recent), 0)
+        self.assertEqual(list(index.entries), sorted(index.entries, key=index._suffix))
+        self.assertEqual(list(index.by_country), sorted(index.by_country, key=index._country_suffix))
+        self.assertEqual([r["id"] for r in index.complete("college 0000", limit=3)], [3, 4, 5])
+
+    def test_memory_bounded_and_reported(self):
+        index = PrefixIndex(20000)
+        index.add_rows([(i, f"University Number {i}", "Peru", "peru") for i in range(1, 2001)])
+        self.assertTrue(index.truncated)
+        self.assertLessEqual(index.nbytes(), 20000)
+        self.assertGreater(len(index), 50)
+
+        autocomplete.get_index()
+        staff = User.objects.create_user('ops', is_staff=True)
+        self.client.force_login(staff)
+        body = self.client.get('/api/metrics/', HTTP_HOST='localhost').content.decode()
+        self.assertIn('# TYPE autocomplete_index_bytes gauge', body)
+        self.assertIn('autocomplete_index_rows 3', body)
+
+    def test_lookup_under_a_millisecond(self):
+        words = ["National", "State", "Technical", "University", "College", "Institute", "Lima", "Paulo", "North"]
+        rng = random.Random(7)
+        index = PrefixIndex(64 * 2 ** 20)
+        index.add_rows([
+            (i, " ".join(rng.choice(words) for _ in range(4)) + f" {i}", f"Country {i % 50}", f"country {i % 50}")
+            for i in range(1, 20001)
+        ])
+        queries = ["u", "uni", "state tech", "lima", "paulo n", "zzz"]
+        started = time.perf_counter()
+        for query in queries * 50:
+            index.complete(query, limit=10)
+            index.complete(query, "country 7", limit=10)
+        self.assertLess((time.perf_counter() - started) / (len(queries) * 100), 0.001)
@@ -0,0 +1,230 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import metrics
+
+LATENCY_SAMPLES = 1000
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised without touching the network while a host's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and lets one trial call
+    through every `reset_timeout` seconds until a call succeeds."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            # One trial at a time; a trial that never reported back is replaced after reset_timeout
+            now = time.monotonic()
+            if state == self.HALF_OPEN and (
+                self._trial_started is None or now - self._trial_started >= self.reset_timeout
+            ):
+                self._trial_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_started = None
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class HostClient:
+    """Keep-alive sessions (sync and async), retry policy, breaker and stats for one upstream host."""
+
+    def __init__(self, host):
+        self.host = host
+        self.session = requests.Session()
+        retry = Retry(
+            total=settings.UPSTREAM_RETRIES,
+            backoff_factor=settings.UPSTREAM_BACKOFF,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({'GET'}),
+            raise_on_status=False,  # the caller gets the last response and calls raise_for_status()
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=settings.UPSTREAM_POOL_SIZE, max_retries=retry
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.breaker = CircuitBreaker(settings.UPSTREAM_BREAKER_FAILURES, settings.UPSTREAM_BREAKER_RESET)
+
+        self.requests = 0
+        self.errors = 0
+        self.short_circuited = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+        self._async_clients = {}  # event loop -> httpx.AsyncClient
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            with self._lock:
+                self.short_circuited += 1
+            raise CircuitOpenError(f'{self.host} is unavailable (circuit open)')
+
+    def get(self, url, **kwargs):
+        self._check_breaker()
+
+        started = time.perf_counter()
+        try:
+            response = self.session.get(url, **kwargs)
+        except requests.RequestException:
+            self._record(started, failed=True)
+            raise
+
+        # Server errors count against the breaker; 4xx are the caller's problem
+        self._record(started, failed=response.status_code >= 500)
+        return response
+
+    def _async_client(self):
+        # An AsyncClient's pool belongs to the loop it was created on; under an ASGI
+        # server that is one loop per process, so connections are reused across requests
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for other in [other for other in self._async_clients if other.is_closed()]:
+                del self._async_clients[other]
+            if loop not in self._async_clients:
+                self._async_clients[loop] = httpx.AsyncClient(limits=httpx.Limits(
+                    max_connections=settings.UPSTREAM_POOL_SIZE,
+                    max_keepalive_connections=settings.UPSTREAM_POOL_SIZE,
+                ))
+            return self._async_clients[loop]
+
+    async def aget(self, url, params=None, headers=None, timeout=None):
+        """Async GET with the same retries and breaker as get().
+
+        Transport errors are re-raised as requests exceptions so callers handle
+        both paths with `except requests.RequestException`.
+        """
+        self._check_breaker()
+        client = self._async_client()
+
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                response = await client.get(url, params=params, headers=headers, timeout=timeout)
+            except httpx.HTTPError as e:
+                if attempt < settings.UPSTREAM_RETRIES:
+                    await asyncio.sleep(settings.UPSTREAM_BACKOFF * 2 ** attempt)
+                    attempt += 1
+                    continue
+                self._record(started, failed=True)
+                error = requests.Timeout if isinstance(e, httpx.TimeoutException) else requests.ConnectionError
+                raise error(f'{self.host}: {e!r}') from e
+
+            if response.status_code in RETRY_STATUSES and attempt < settings.UPSTREAM_RETRIES:
+                await asyncio.sleep(settings.UPSTREAM_BACKOFF * 2 ** attempt)
+                attempt += 1
+                continue
+
+            self._record(started, failed=response.status_code >= 500)
+            return response
+
+    def _record(self, started, failed):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.requests += 1
+            self.errors += failed
+            self.latencies.append(elapsed)
+        metrics.record_upstream(self.host, elapsed)
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            requests_, errors, short_circuited = self.requests, self.errors, self.short_circuited
+
+        def percentile_ms(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            "requests": requests_,
+            "errors": errors,
+            "short_circuited": short_circuited,
+            "p50_ms": percentile_ms(0.50),
+            "p99_ms": percentile_ms(0.99),
+            "breaker": self.breaker.state,
+        }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client_for(url):
+    parts = urlsplit(url)
+    host = f'{parts.scheme}://{parts.netloc}'
+    with _clients_lock:
+        if host not in _clients:
+            _clients[host] = HostClient(host)
+        return _clients[host]
+
+
+def get(url, **kwargs):
+    """requests.get through the shared per-host client (raises requests.RequestException)."""
+    return client_for(url).get(url, **kwargs)
+
+
+async def aget(url, **kwargs):
+    """Async GET through the shared per-host client; call raise_for_status() on the result."""
+    return await client_for(url).aget(url, **kwargs)
+
+
+def raise_for_status(response):
+    """requests-style raise_for_status() for an httpx response."""
+    if response.is_error:
+        raise requests.HTTPError(f'{response.status_code} Error for url: {response.url}')
+
+
+def stats():
+    """Per-host request, error, latency and breaker stats for this process."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.host: client.stats() for client in clients}
@@ -1,10 +1,22 @@
 from django.urls import path
 from .views import *
+from . import views_async
 
 urlpatterns = [
     path('test/', test_view, name='test'),
     path('universities/', UniversityListView.as_view(), name='university-list'),
+    path('universities/export/', university_export, name='university-export'),
+    path('universities/autocomplete/', university_autocomplete, name='university-autocomplete'),
+    path('universities/nearby/', UniversityNearbyView.as_view(), name='university-nearby'),
     path('search-university/', UniversitySearchView.as_view(), name='university-search'),
+    path('search-university/batch/', UniversityBatchSearchView.as_view(), name='university-search-batch'),
     path('university-locations/', UniversityLocationsView.as_view(), name='university-locations'),
+    path('university-clusters/', UniversityClustersView.as_view(), name='university-clusters'),
     path("user/", CurrentUserView.as_view(), name="current-user"),
+    path('favorites/', FavoriteListView.as_view(), name='favorite-list'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+
+    # Async variants for ASGI deployments
+    path('async/universities/', views_async.university_list, name='university-list-async'),
+    path('async/search-university/', views_async.university_search, name='university-search-async'),
 ]
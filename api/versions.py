@@ -0,0 +1,74 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import DataVersion
+
+VERSION_KEY = 'universities:version'
+FAVORITES_KEY = 'favorites:version'
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache():
+    """True if the default cache is visible to every process (not locmem/dummy)."""
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+
+def _key(country_key):
+    return f'{VERSION_KEY}:{country_key}' if country_key is not None else VERSION_KEY
+
+
+def _read(key):
+    if shared_cache():
+        version = cache.get(key)
+        if version is not None:
+            return version
+
+    version = DataVersion.objects.filter(key=key).values_list('version', flat=True).first()
+    if version is None:
+        # Never bumped: start a version so there is something to compare against
+        DataVersion.objects.bulk_create([DataVersion(key=key, version=time.time_ns())], ignore_conflicts=True)
+        version = DataVersion.objects.get(key=key).version
+
+    if shared_cache():
+        cache.add(key, version, None)  # add, so a concurrent bump() is never overwritten
+    return version
+
+
+def _write(keys):
+    now = time.time_ns()
+    DataVersion.objects.bulk_create(
+        [DataVersion(key=key, version=now) for key in keys],
+        update_conflicts=True, unique_fields=['key'], update_fields=['version'],
+    )
+    if shared_cache():
+        cache.set_many({key: now for key in keys}, None)
+
+
+def current_version(country_key=None):
+    """Version token of the University data (of one country, or of the whole table).
+
+    Versions are time_ns() values taken when the data last changed, so they also
+    serve as Last-Modified timestamps. They live in the DataVersion table so that
+    bumps by the geocode worker and management commands reach every web process;
+    a shared cache, when configured, answers in front of it.
+    """
+    return _read(_key(country_key))
+
+
+def bump(country_keys=()):
+    """Mark the given countries (and the table as a whole) as changed."""
+    _write([_key(None), *{_key(k) for k in country_keys}])
+
+
+def favorites_version(user_id):
+    """Version token of one user's favorites."""
+    return _read(f'{FAVORITES_KEY}:{user_id}')
+
+
+def bump_favorites(user_id):
+    _write([f'{FAVORITES_KEY}:{user_id}'])
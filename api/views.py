@@ -1,11 +1,32 @@
 from rest_framework import generics, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from django.utils.decorators import method_decorator
 import requests
 from decouple import config
-from .models import University
-from .serializers import UniversitySerializer
+from django.conf import settings
+from django.db.models import Q
+from .autocomplete import get_index as autocomplete_index
+from .clusters import clusters_in_view, country_bounds
+from .countries import normalize_country
+from .export import FORMATS, export_stream
+from .favorites import add_favorites, remove_favorites
+from .fastjson import dumps, university_rows
+from .geocoding import geocode, with_progress
+from .hipolabs import fetch_country
+from .http_cache import versioned
+from . import metrics
+from .ingest import ingest_fetched
+from .models import FavoriteUniversity, University
+from .nearby import nearby_universities
+from .pagination import KeysetPagination
+from .resolve import resolve_names
+from .search import search_universities
+from .serializers import FavoriteSerializer, UniversitySerializer
+from .singleflight import single_flight
+from .snapshots import get_snapshot, has_snapshot, locations_payload, snapshot_response
 from rest_framework.permissions import IsAuthenticated
 
 GOOGLE_API_KEY = config("GOOGLE_API_KEY")
@@ -33,81 +54,78 @@ def test_view(request):
 # --------------------------
 # 1. List all universities (from DB or Hipolabs API)
 # --------------------------
+@method_decorator(versioned(), name='dispatch')
 class UniversityListView(generics.ListAPIView):
     serializer_class = UniversitySerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetPagination
+    fast_json = True  # encode unpaginated lists from values_list (api/fastjson.py) instead of the serializer
+    load_missing = True  # fetch countries that are not stored yet (False when the caller already tried)
 
     def get_queryset(self):
         country = self.request.query_params.get('country', None)
 
         if not country:
             return University.objects.all()
+        return University.objects.filter(country_key=normalize_country(country))
+
+    def load_country(self, country):
+        """Fetch a country that is not stored yet; False if another request is still loading it.
+
+        Concurrent requests for the same country share one Hipolabs fetch: the
+        first one loads it while the rest wait up to COLD_FETCH_WAIT seconds.
+        """
+        country_key = normalize_country(country)
+        qs = University.objects.filter(country_key=country_key)
 
         # Check if there are universities stored for this country
-        qs = University.objects.filter(country__iexact=country)
         if qs.exists():
-            return qs
+            return True
+
+        with single_flight(f'country:{country_key}', settings.COLD_FETCH_WAIT, settings.COLD_FETCH_LOCK_TIMEOUT) as acquired:
+            if not acquired:
+                return False
+            if qs.exists():  # loaded by the request we waited for
+                return True
+
+            # If not, fetch from Hipolabs API
+            try:
+                data = fetch_country(country)
+            except requests.RequestException:
+                return True  # Serve the empty list if API fails
+
+            # Save the rows now and leave geocoding to the background worker
+            ingest_fetched(country, data)
+        return True
+
+    def list(self, request, *args, **kwargs):
+        country = request.query_params.get('country')
+        plain_json = request.accepted_renderer.format == 'json' and not self.paginator.is_paginated(request)
+
+        # Featured countries are served from a pre-rendered snapshot
+        if plain_json and has_snapshot(country):
+            snapshot = get_snapshot('list', normalize_country(country))
+            if not snapshot.empty:  # empty means not loaded yet
+                return snapshot_response(request, snapshot)
+
+        if country and self.load_missing and not self.load_country(country):
+            return Response(
+                {"status": "loading", "country": country}, status=202, headers={'Retry-After': '2'}
+            )
+
+        if plain_json and self.fast_json:
+            rows = university_rows(self.filter_queryset(self.get_queryset()))
+            return HttpResponse(dumps(with_progress(country, rows), rows), content_type='application/json')
+
+        response = super().list(request, *args, **kwargs)
+
+        # Report geocoding progress until the worker has filled in coordinates
+        if country:
+            response.data = with_progress(country, response.data)
+        return response
 
-        # If not, fetch from Hipolabs API
-        url = f"http://universities.hipolabs.com/search?country={country}"
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-        except requests.RequestException:
-            return University.objects.none()  # Return empty queryset if API fails
-
-        # Optionally save to DB for caching/favorites
-        universities = []
-        for uni in data:
-            name = uni.get("name")
-            if name:
-                # Try to get coordinates for the university
-                state_province = uni.get("state-province", "")
-                search_query = f"{name} {state_province} {country}".strip()
-
-                # Get coordinates using Nominatim
-                lat, lng = None, None
-                try:
-                    nominatim_url = "https://nominatim.openstreetmap.org/search"
-                    params = {
-                        "q": search_query,
-                        "format": "json",
-                        "limit": 1,
-                        "addressdetails": 1
-                    }
-                    response = requests.get(nominatim_url, params=params, headers={
-                        'User-Agent': 'UniversityFinder/1.0'
-                    }, timeout=5)
-                    response.raise_for_status()
-                    nominatim_data = response.json()
-
-                    if nominatim_data:
-                        lat = float(nominatim_data[0].get("lat"))
-                        lng = float(nominatim_data[0].get("lon"))
-                except:
-                    pass  # Continue without coordinates if geocoding fails
-
-                obj, created = University.objects.get_or_create(
-                    name=name,
-                    country=country,
-                    defaults={'lat': lat, 'lng': lng}
-                )
-
-                # Update coordinates if they weren't set before
-                if created and lat and lng:
-                    pass  # Already set in defaults
-                elif not obj.lat and lat and lng:
-                    obj.lat = lat
-                    obj.lng = lng
-                    obj.save()
-
-                universities.append(obj)
-
-        return universities
-
-# --------------------------
-# 2. Search university by name (OpenStreetMap Nominatim API)
+# --------------------------
+# 2. Search university by name (local index, then OpenStreetMap Nominatim API), one or many at a time
 # --------------------------
 class UniversitySearchView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -117,68 +135,239 @@ class UniversitySearchView(APIView):
         if not name:
             return Response({"error": "Missing 'name' parameter"}, status=400)
 
-        # Use OpenStreetMap Nominatim API (free, no API key needed)
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            "q": name,
-            "format": "json",
-            "limit": 1,
-            "addressdetails": 1,
-            "extratags": 1
-        }
-
+        # Try the universities we already have first
+        country = request.query_params.get('country')
+        matches = search_universities(name, country_key=normalize_country(country) if country else None)
+        located = [m for m in matches if m["lat"] is not None and m["lng"] is not None]
+        if located:
+            best = located[0]
+            return Response({
+                "name": best["name"],
+                "address": f"{best['name']}, {best['country']}",
+                "lat": best["lat"],
+                "lng": best["lng"],
+                "source": "local",
+                "matches": located,
+            })
+
+        # Fall back to OpenStreetMap Nominatim API (free, no API key needed), through the geocode cache
         try:
-            response = requests.get(url, params=params, headers={
-                'User-Agent': 'UniversityFinder/1.0'  # Required by Nominatim
-            }, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-
-            if data and len(data) > 0:
-                result = data[0]
-                return Response({
-                    "name": result.get("display_name", "").split(",")[0],  # Get just the name part
-                    "address": result.get("display_name"),
-                    "lat": float(result.get("lat")),
-                    "lng": float(result.get("lon"))
-                })
-
+            result = geocode(name, timeout=10)
         except requests.RequestException as e:
             return Response({"error": f"Geocoding service unavailable: {str(e)}"}, status=503)
 
+        if result:
+            return Response({
+                "name": result["display_name"].split(",")[0],  # Get just the name part
+                "address": result["display_name"],
+                "lat": result["lat"],
+                "lng": result["lng"],
+                "source": "nominatim",
+            })
+
         return Response({"error": "University not found"}, status=404)
 
 
+class UniversityBatchSearchView(APIView):
+    """POST {"items": ["name", {"name": ..., "country": ...}, ...]}: one result per item, in input order."""
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        items = request.data.get('items') if hasattr(request.data, 'get') else None
+        max_items = settings.RESOLVE_MAX_ITEMS
+        if not isinstance(items, list) or not 0 < len(items) <= max_items:
+            return Response({"error": f"'items' must be a list of 1 to {max_items} names"}, status=400)
+
+        parsed = []
+        for item in items:
+            if isinstance(item, str):
+                item = {"name": item}
+            name = item.get('name') if isinstance(item, dict) else None
+            country = item.get('country') if isinstance(item, dict) else None
+            if not isinstance(name, str) or not name.strip() or not isinstance(country, (str, type(None))):
+                return Response({"error": "Each item must be a name or an object with 'name' and optional 'country'"}, status=400)
+            parsed.append((name.strip(), country or None))
+
+        return Response({"results": resolve_names(parsed)})
+
+
 # --------------------------
 # 3. Get university locations for map display (OpenStreetMap Nominatim)
 # --------------------------
+@method_decorator(versioned(default_country='Philippines'), name='dispatch')
 class UniversityLocationsView(APIView):
     permission_classes = [permissions.AllowAny]
+    fast_json = True  # build markers from values_list (api/fastjson.py) instead of model instances
 
     def get(self, request):
         country = request.query_params.get('country', 'Philippines')
 
-        # Get universities from database that have coordinates
-        universities = University.objects.filter(
-            country__iexact=country,
-            lat__isnull=False,
-            lng__isnull=False
-        )[:50]  # Limit to 50 universities with coordinates
-
-        locations = []
-        for uni in universities:
-            # Use stored coordinates (prioritize database over API calls)
-            location_data = {
-                "id": uni.id,
-                "name": uni.name,
-                "country": uni.country,
-                "lat": uni.lat,
-                "lng": uni.lng,
-                "address": f"{uni.name}, {uni.country}",
-                "place_id": ""
-            }
-            locations.append(location_data)
+        country_key = normalize_country(country)
+        if request.accepted_renderer.format == 'json':
+            # Featured countries are served from a pre-rendered snapshot
+            if has_snapshot(country):
+                return snapshot_response(request, get_snapshot('locations', country_key))
+            if self.fast_json:
+                locations, rows = locations_payload(country_key)
+                return HttpResponse(dumps(locations, rows), content_type='application/json')
 
+        locations, _ = locations_payload(country_key, fast=False)
         return Response(locations)
 
 
+# --------------------------
+# 4. Universities near a point (geohash index + haversine ranking)
+# --------------------------
+class UniversityNearbyView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            lat = float(request.query_params['lat'])
+            lng = float(request.query_params['lng'])
+            radius = float(request.query_params.get('radius', settings.NEARBY_DEFAULT_RADIUS_KM))
+            limit = int(request.query_params.get('limit', 20))
+        except (KeyError, ValueError):
+            return Response({"error": "'lat' and 'lng' are required; 'radius' (km) and 'limit' must be numbers"}, status=400)
+
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or radius <= 0 or limit <= 0:
+            return Response({"error": "Coordinates out of range or non-positive radius/limit"}, status=400)
+
+        radius = min(radius, settings.NEARBY_MAX_RADIUS_KM)
+        limit = min(limit, 100)
+        return Response(nearby_universities(lat, lng, radius, limit))
+
+
+# --------------------------
+# 5. Map clusters for a viewport (precomputed grid clusters per zoom level)
+# --------------------------
+class UniversityClustersView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        country_key = normalize_country(request.query_params.get('country', 'Philippines'))
+
+        try:
+            zoom = max(0, min(int(request.query_params.get('zoom', 0)), 22))
+            bbox = request.query_params.get('bbox')
+            bbox = tuple(float(v) for v in bbox.split(',')) if bbox else None
+        except ValueError:
+            return Response({"error": "'zoom' must be an integer and 'bbox' south,west,north,east"}, status=400)
+
+        if bbox is not None and (len(bbox) != 4 or bbox[0] > bbox[2]):
+            return Response({"error": "'bbox' must be south,west,north,east"}, status=400)
+
+        # Without a viewport, cover the whole country and tell the client where that is
+        bounds = None
+        if bbox is None:
+            bounds = country_bounds(country_key)
+            if bounds is None:
+                return Response({"zoom": zoom, "clusters": [], "points": [], "bounds": None})
+            bbox = (bounds['south'], bounds['west'], bounds['north'], bounds['east'])
+
+        data = clusters_in_view(country_key, zoom, bbox)
+        data["bounds"] = bounds
+        return Response(data)
+
+
+# --------------------------
+# 6. Favorites of the current user (bulk add/remove)
+# --------------------------
+class FavoriteListView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_bulk = 1000
+
+    def get(self, request):
+        favorites = (
+            FavoriteUniversity.objects.filter(user=request.user)
+            .select_related('university')
+            .order_by('-added_at', '-id')
+        )
+        return Response(FavoriteSerializer(favorites, many=True).data)
+
+    def post(self, request):
+        ids = self.university_ids(request)
+        if ids is None:
+            return self.bad_ids()
+        added, missing = add_favorites(request.user, ids)
+        return Response({"added": added, "not_found": missing}, status=201 if added else 200)
+
+    def delete(self, request):
+        ids = self.university_ids(request)
+        if ids is None:
+            return self.bad_ids()
+        return Response({"removed": remove_favorites(request.user, ids)})
+
+    def university_ids(self, request):
+        ids = request.data.get('university_ids') if hasattr(request.data, 'get') else None
+        if not isinstance(ids, list) or not 0 < len(ids) <= self.max_bulk:
+            return None
+        if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            return None
+        return ids
+
+    def bad_ids(self):
+        return Response({"error": f"'university_ids' must be a list of 1 to {self.max_bulk} integers"}, status=400)
+
+
+# --------------------------
+# 7. Bulk export as a stream (NDJSON, GeoJSON or CSV)
+# --------------------------
+@require_GET
+def university_export(request):
+    # A plain Django view: DRF would treat ?format= as a renderer override
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return JsonResponse({"error": f"'format' must be one of: {', '.join(FORMATS)}"}, status=400)
+
+    queryset = University.objects.all()
+    country = request.GET.get('country')
+    if country:
+        queryset = queryset.filter(country_key=normalize_country(country))
+
+    has_coordinates = request.GET.get('has_coordinates')
+    if has_coordinates in ('true', '1'):
+        queryset = queryset.filter(lat__isnull=False, lng__isnull=False)
+    elif has_coordinates in ('false', '0'):
+        queryset = queryset.filter(Q(lat__isnull=True) | Q(lng__isnull=True))
+    elif has_coordinates is not None:
+        return JsonResponse({"error": "'has_coordinates' must be true or false"}, status=400)
+
+    gzipped = request.GET.get('compress') == 'gzip'
+    content_type, extension = FORMATS[fmt]
+    response = StreamingHttpResponse(export_stream(queryset, fmt, gzipped=gzipped), content_type=content_type)
+    filename = f"universities-{normalize_country(country).replace(' ', '-') if country else 'all'}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    if gzipped:
+        response['Content-Encoding'] = 'gzip'
+    return response
+
+
+# --------------------------
+# 8. Request metrics in Prometheus text format (staff only)
+# --------------------------
+class MetricsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+# --------------------------
+# 9. Name suggestions for the search box (in-memory prefix index)
+# --------------------------
+@require_GET
+def university_autocomplete(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({"error": "'q' is required"}, status=400)
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        return JsonResponse({"error": "'limit' must be a number"}, status=400)
+    if limit <= 0:
+        return JsonResponse({"error": "'limit' must be positive"}, status=400)
+
+    country = request.GET.get('country')
+    results = autocomplete_index().complete(query, normalize_country(country) if country else None, min(limit, 50))
+    return HttpResponse(dumps({"results": results}), content_type='application/json')
@@ -0,0 +1,106 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+import requests
+from .countries import normalize_country
+from .fastjson import dumps
+from .geocoding import ageocode
+from .hipolabs import afetch_country
+from .ingest import ingest_fetched
+from .models import University
+from .search import search_universities
+from .singleflight import async_single_flight
+from .views import UniversityListView
+
+# Async variants of the endpoints that wait on Hipolabs/Nominatim. Under an ASGI
+# server (see Procfile) an upstream wait only parks a coroutine, so one worker can
+# hold many of them; everything that touches the DB runs in sync_to_async.
+
+# load_country() below has already fetched the country (or failed to), so don't fetch it again
+university_list_view = UniversityListView.as_view(load_missing=False)
+
+
+def json_response(data, status=200, rows=(), headers=None):
+    # Same bytes as the DRF views' JSON responses
+    return HttpResponse(dumps(data, rows), status=status, content_type='application/json', headers=headers)
+
+
+# --------------------------
+# 1. List universities; a country that is not stored yet is fetched without blocking the worker
+# --------------------------
+async def load_country(country):
+    """Async UniversityListView.load_country(): False if another request is still loading it."""
+    country_key = normalize_country(country)
+    qs = University.objects.filter(country_key=country_key)
+    if await qs.aexists():
+        return True
+
+    async with async_single_flight(
+        f'country:{country_key}', settings.COLD_FETCH_WAIT, settings.COLD_FETCH_LOCK_TIMEOUT
+    ) as acquired:
+        if not acquired:
+            return False
+        if await qs.aexists():
+            return True
+
+        try:
+            data = await afetch_country(country)
+        except requests.RequestException:
+            return True  # Serve the empty list if API fails
+
+        await sync_to_async(ingest_fetched)(country, data)
+    return True
+
+
+@require_GET
+async def university_list(request):
+    country = request.GET.get('country')
+    if country and not await load_country(country):
+        return json_response({"status": "loading", "country": country}, status=202, headers={'Retry-After': '2'})
+
+    # The country is stored now (or Hipolabs failed), so the regular view serves it
+    # (snapshots, caching, pagination)
+    return await sync_to_async(university_list_view)(request)
+
+
+# --------------------------
+# 2. Search university by name (local index, then Nominatim without blocking the worker)
+# --------------------------
+@require_GET
+async def university_search(request):
+    name = request.GET.get('name')
+    if not name:
+        return json_response({"error": "Missing 'name' parameter"}, status=400)
+
+    country = request.GET.get('country')
+    matches = await sync_to_async(search_universities)(
+        name, country_key=normalize_country(country) if country else None
+    )
+    located = [m for m in matches if m["lat"] is not None and m["lng"] is not None]
+    if located:
+        best = located[0]
+        return json_response({
+            "name": best["name"],
+            "address": f"{best['name']}, {best['country']}",
+            "lat": best["lat"],
+            "lng": best["lng"],
+            "source": "local",
+            "matches": located,
+        }, rows=located)
+
+    try:
+        result = await ageocode(name, timeout=10)
+    except requests.RequestException as e:
+        return json_response({"error": f"Geocoding service unavailable: {str(e)}"}, status=503)
+
+    if result:
+        return json_response({
+            "name": result["display_name"].split(",")[0],
+            "address": result["display_name"],
+            "lat": result["lat"],
+            "lng": result["lng"],
+            "source": "nominatim",
+        }, rows=[result])
+
+    return json_response({"error": "University not found"}, status=404)
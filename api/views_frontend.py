@@ -1,29 +1,64 @@
-import os
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.template.loader import get_template, render_to_string
+from .countries import FEATURED_COUNTRIES, normalize_country
+from .favorites import favorite_ids
+from .http_cache import versioned
 from .models import University
-from decouple import config
+from .search import get_index
+
+STREAM_MARKER = '<!-- university cards -->'
+
 
 def home_view(request):
     return render(request, "home.html", {
-        'google_api_key': config('GOOGLE_API_KEY'),
+        'google_api_key': settings.GOOGLE_API_KEY,
     })
 
+
+def page_url(request, page, partial=False):
+    params = request.GET.copy()
+    params['page'] = page
+    if partial:
+        params['partial'] = '1'
+    else:
+        params.pop('partial', None)
+    return f'{request.path}?{params.urlencode()}'
+
+
+def stream_universities(request, context, queryset):
+    """Send the page shell right away, then the cards in batches as rows come off the cursor."""
+    page = render_to_string("universities.html", {**context, 'stream': True}, request)
+    if STREAM_MARKER not in page:  # no cards (empty list or error)
+        return HttpResponse(page)
+    head, tail = page.split(STREAM_MARKER, 1)
+    cards = get_template("university_cards.html")
+    batch_size = settings.UNIVERSITIES_PAGE_SIZE
+
+    def chunks():
+        yield head
+        batch = []
+        for uni in queryset.iterator(chunk_size=batch_size):
+            batch.append(uni)
+            if len(batch) == batch_size:
+                yield cards.render({**context, 'universities': batch}, request)
+                batch = []
+        if batch:
+            yield cards.render({**context, 'universities': batch}, request)
+        yield tail
+
+    return StreamingHttpResponse(chunks(), content_type='text/html; charset=utf-8')
+
+
 @login_required
+@versioned(default_country='Philippines', cache_responses=False, vary_on_user=True)
 def university_view(request):
     # Define the specific countries to display
-    available_countries = [
-        "Philippines",
-        "Japan",
-        "India",
-        "Australia",
-        "Canada",
-        "Singapore",
-        "Thailand",
-        "Saudi Arabia",
-        "United Kingdom",
-    ]
+    available_countries = FEATURED_COUNTRIES
 
     selected_country = request.GET.get('country', 'Philippines')  # Default to Philippines
     search_query = request.GET.get('search', '').strip()
@@ -35,11 +70,16 @@ def university_view(request):
     # Always load universities for the selected country (defaulting to Philippines)
     try:
         # Start with country filter
-        queryset = University.objects.filter(country=selected_country)
+        queryset = University.objects.filter(country_key=normalize_country(selected_country))
 
-        # Apply search filter if search query exists
+        # Apply search filter if search query exists, using the in-memory trigram index
+        # when the query is long enough and selective enough to beat a table scan
         if search_query:
-            queryset = queryset.filter(name__icontains=search_query)
+            ids = get_index().substring_ids(search_query, normalize_country(selected_country))
+            if ids is None or len(ids) > 5000:
+                queryset = queryset.filter(name__icontains=search_query)
+            else:
+                queryset = queryset.filter(id__in=ids)
 
         # Order by name
         universities = queryset.order_by('name')
@@ -50,17 +90,33 @@ def university_view(request):
         'countries': available_countries,
         'selected_country': selected_country,
         'search_query': search_query,
-        'universities': universities,
         'loading': loading,
         'error': error,
-        'google_api_key': config('GOOGLE_API_KEY'),
-        'google_map_id': os.getenv('GOOGLE_MAP_ID', ''),  # Pass Map ID to template
+        'favorite_ids': favorite_ids(request),  # one cached set, checked per card without queries
+        'google_api_key': settings.GOOGLE_API_KEY,
+        'google_map_id': settings.GOOGLE_MAP_ID,  # Pass Map ID to template
     }
 
     # Use different templates based on the URL
-    if request.path == '/universities/':
-        return render(request, "universities.html", context)
-    else:
-        return render(request, "home.html", context)
+    if request.path != '/universities/':
+        return render(request, "home.html", {**context, 'universities': universities})
+
+    # ?stream=1 sends every card as it is read instead of one page at a time
+    if request.GET.get('stream') == '1' and not error:
+        context['has_universities'] = universities.exists()
+        return stream_universities(request, context, universities)
+
+    page = Paginator(universities, settings.UNIVERSITIES_PAGE_SIZE).get_page(request.GET.get('page'))
+    context.update({
+        'universities': page,
+        'has_universities': bool(page.object_list),
+        'next_page_url': page_url(request, page.next_page_number(), partial=True) if page.has_next() else None,
+        'next_page_link': page_url(request, page.next_page_number()) if page.has_next() else None,
+    })
+
+    # Infinite scroll asks for the next page's cards only
+    if request.GET.get('partial') == '1':
+        return render(request, "university_cards.html", context)
+    return render(request, "universities.html", context)
 
 
@@ -38,6 +38,7 @@ DEBUG = config("DEBUG", default=False, cast=bool)
 GOOGLE_CLIENT_ID = config("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = config("GOOGLE_CLIENT_SECRET")
 GOOGLE_API_KEY = config("GOOGLE_API_KEY")
+GOOGLE_MAP_ID = config("GOOGLE_MAP_ID", default="")
 
 ALLOWED_HOSTS = ["university-finder-api.onrender.com", "127.0.0.1", "localhost"]
 
@@ -155,6 +156,7 @@ REST_USE_JWT = True  # use JWT for authentication
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'api.middleware.metrics_middleware',  # per-route timings, served at /api/metrics/
     'csp.middleware.CSPMiddleware',  # Content Security Policy
     'django.contrib.sessions.middleware.SessionMiddleware',
     "corsheaders.middleware.CorsMiddleware", # must be above CommonMiddleware
@@ -256,6 +258,10 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.JSONRenderer",  # timed, see api/metrics.py
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": None,
 }
@@ -272,4 +278,89 @@ CORS_ALLOWED_ORIGINS = [
     "https://university-finder-api.onrender.com",    # React frontend
 ]
 
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+
+# Upstream APIs
+HIPOLABS_URL = config("HIPOLABS_URL", default="http://universities.hipolabs.com/search")
+NOMINATIM_URL = config("NOMINATIM_URL", default="https://nominatim.openstreetmap.org/search")
+NOMINATIM_USER_AGENT = config("NOMINATIM_USER_AGENT", default="UniversityFinder/1.0")
+NOMINATIM_RATE_LIMIT = config("NOMINATIM_RATE_LIMIT", default=1.0, cast=float)  # req/s across all processes (DB-backed), 0 disables
+
+# Background geocoding (python manage.py geocode_worker)
+GEOCODE_MAX_ATTEMPTS = config("GEOCODE_MAX_ATTEMPTS", default=3, cast=int)
+
+# Geocode cache: in-process LRU in front of the GeocodeCacheEntry table
+GEOCODE_LRU_SIZE = config("GEOCODE_LRU_SIZE", default=4096, cast=int)
+GEOCODE_CACHE_TTL = config("GEOCODE_CACHE_TTL", default=60 * 60 * 24 * 90, cast=int)  # seconds, found results
+GEOCODE_NEGATIVE_TTL = config("GEOCODE_NEGATIVE_TTL", default=60 * 60 * 24, cast=int)  # seconds, misses
+
+# Bulk ingestion (load_universities / fetch_universities)
+INGEST_BATCH_SIZE = config("INGEST_BATCH_SIZE", default=500, cast=int)
+
+# Cache (rendered responses, snapshots). Data versions live in the database, so
+# locmem is safe with several workers; a shared backend (e.g. CACHE_BACKEND=
+# django.core.cache.backends.db.DatabaseCache CACHE_LOCATION=cache_table) is
+# shared between them and also answers version lookups in front of the database.
+CACHES = {
+    "default": {
+        "BACKEND": config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CACHE_LOCATION", default="university-finder"),
+    }
+}
+
+# Local name search (api/search.py)
+SEARCH_MIN_SIMILARITY = config("SEARCH_MIN_SIMILARITY", default=0.5, cast=float)
+SEARCH_INDEX_REFRESH_INTERVAL = config("SEARCH_INDEX_REFRESH_INTERVAL", default=5.0, cast=float)  # seconds
+
+# Search-box suggestions (/api/universities/autocomplete/, api/autocomplete.py)
+AUTOCOMPLETE_MAX_MB = config("AUTOCOMPLETE_MAX_MB", default=128, cast=int)  # per process; universities past it are left out
+AUTOCOMPLETE_REFRESH_INTERVAL = config("AUTOCOMPLETE_REFRESH_INTERVAL", default=5.0, cast=float)  # seconds
+AUTOCOMPLETE_WARM_UP = config("AUTOCOMPLETE_WARM_UP", default=True, cast=bool)  # build the index when a worker starts
+
+# Batch name resolution (/api/search-university/batch/)
+RESOLVE_MAX_ITEMS = config("RESOLVE_MAX_ITEMS", default=5000, cast=int)  # names per request
+RESOLVE_MAX_GEOCODES = config("RESOLVE_MAX_GEOCODES", default=20, cast=int)  # uncached Nominatim lookups per request
+RESOLVE_GEOCODE_CONCURRENCY = config("RESOLVE_GEOCODE_CONCURRENCY", default=4, cast=int)  # of those, in flight at once
+
+# Nearby search (/api/universities/nearby/)
+NEARBY_DEFAULT_RADIUS_KM = config("NEARBY_DEFAULT_RADIUS_KM", default=25.0, cast=float)
+NEARBY_MAX_RADIUS_KM = config("NEARBY_MAX_RADIUS_KM", default=500.0, cast=float)
+
+# Map clustering (/api/university-clusters/)
+CLUSTER_MAX_ZOOM = config("CLUSTER_MAX_ZOOM", default=14, cast=int)  # above this, individual points are returned
+CLUSTER_CELL_PX = config("CLUSTER_CELL_PX", default=64, cast=int)  # grid cell size in screen pixels
+CLUSTER_REBUILD_INTERVAL = config("CLUSTER_REBUILD_INTERVAL", default=60, cast=float)  # seconds between worker rebuilds of a country still being geocoded
+CLUSTER_REBUILD_LOCK_TIMEOUT = config("CLUSTER_REBUILD_LOCK_TIMEOUT", default=600, cast=int)  # seconds
+
+# Rendered responses cached per data version (api/http_cache.py)
+RESPONSE_CACHE_TIMEOUT = config("RESPONSE_CACHE_TIMEOUT", default=60 * 60, cast=int)  # seconds
+UNIVERSITIES_PAGE_SIZE = config("UNIVERSITIES_PAGE_SIZE", default=60, cast=int)  # cards per page (and per streamed chunk) on /universities/
+FAVORITES_CACHE_TIMEOUT = config("FAVORITES_CACHE_TIMEOUT", default=60 * 60, cast=int)  # per-user favorite-ID sets (api/favorites.py)
+
+# Pre-rendered list/locations payloads for the featured countries (api/snapshots.py)
+SNAPSHOT_CACHE_TIMEOUT = config("SNAPSHOT_CACHE_TIMEOUT", default=24 * 60 * 60, cast=int)  # seconds
+SNAPSHOT_GZIP_LEVEL = config("SNAPSHOT_GZIP_LEVEL", default=6, cast=int)
+SNAPSHOT_DIR = config("SNAPSHOT_DIR", default=str(BASE_DIR / "snapshots"))  # rendered snapshots shared by the workers of a host
+
+# Streaming export (/api/universities/export/)
+EXPORT_CHUNK_ROWS = config("EXPORT_CHUNK_ROWS", default=2000, cast=int)  # rows fetched per cursor round trip
+EXPORT_BLOCK_BYTES = config("EXPORT_BLOCK_BYTES", default=64 * 1024, cast=int)  # bytes per streamed chunk
+EXPORT_GZIP_LEVEL = config("EXPORT_GZIP_LEVEL", default=6, cast=int)  # for ?compress=gzip
+
+# Cold-country fetches in /api/universities/ run once per country (api/singleflight.py)
+COLD_FETCH_WAIT = config("COLD_FETCH_WAIT", default=15.0, cast=float)  # seconds a request waits before getting a 202
+COLD_FETCH_LOCK_TIMEOUT = config("COLD_FETCH_LOCK_TIMEOUT", default=120, cast=int)  # seconds
+
+# Outbound HTTP to Hipolabs/Nominatim (api/upstream.py)
+UPSTREAM_POOL_SIZE = config("UPSTREAM_POOL_SIZE", default=10, cast=int)  # keep-alive connections per host
+UPSTREAM_RETRIES = config("UPSTREAM_RETRIES", default=2, cast=int)  # on connection errors, 429 and 5xx
+UPSTREAM_BACKOFF = config("UPSTREAM_BACKOFF", default=0.5, cast=float)  # seconds, doubled per retry
+UPSTREAM_BREAKER_FAILURES = config("UPSTREAM_BREAKER_FAILURES", default=5, cast=int)  # consecutive failures that open the breaker
+UPSTREAM_BREAKER_RESET = config("UPSTREAM_BREAKER_RESET", default=30.0, cast=float)  # seconds before a trial call
+
+# Async endpoints (/api/async/..., api/views_async.py)
+ASYNC_GEOCODE_CONCURRENCY = config("ASYNC_GEOCODE_CONCURRENCY", default=4, cast=int)  # Nominatim lookups in flight per process
+
+# Request metrics (api/metrics.py, served to staff at /api/metrics/)
+METRICS_ENABLED = config("METRICS_ENABLED", default=True, cast=bool)
+SLOW_REQUEST_MS = config("SLOW_REQUEST_MS", default=0, cast=float)  # log a query/time breakdown of slower requests; 0 disables
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402  (needs the app registry set up above)
+
+if settings.AUTOCOMPLETE_WARM_UP:
+    from api.autocomplete import warm_up  # noqa: E402
+    warm_up()